@@ -8,14 +8,20 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse
 from pydantic import BaseModel
 from typing import Optional, List
+import numpy as np
 import pandas as pd
 import os
 from datetime import date
+from src.panel import PanelStore, PANEL_FIELDS
+from src.sweep import sweep_thresholds, SWEEP_BY
+from src.store import read_output
 
 # Get the project root directory
 API_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_DIR = os.path.dirname(API_DIR)
 OUTPUTS_DIR = os.path.join(PROJECT_DIR, "outputs")
+# written by `python -m src.walkforward --panel-dir ...`; optional
+PANEL_DIR = os.environ.get("PANEL_DIR", os.path.join(OUTPUTS_DIR, "panel"))
 
 app = FastAPI(
     title="Stock Market Anomaly Detection API",
@@ -41,15 +47,20 @@ app.add_middleware(
 daily_anomalies: pd.DataFrame = None
 market_days: pd.DataFrame = None
 features_flags: pd.DataFrame = None
+panel: PanelStore = None
 
 def load_data():
-    global daily_anomalies, market_days, features_flags
+    global daily_anomalies, market_days, features_flags, panel
     try:
-        daily_anomalies = pd.read_csv(os.path.join(OUTPUTS_DIR, "daily_anomaly_card.csv"))
-        market_days = pd.read_csv(os.path.join(OUTPUTS_DIR, "market_day_table.csv"))
-        features_flags = pd.read_csv(os.path.join(OUTPUTS_DIR, "features_and_flags.csv"))
+        # typed month partitions from outputs/store when published, else the CSVs
+        daily_anomalies = read_output(OUTPUTS_DIR, "daily_anomaly_card")
+        market_days = read_output(OUTPUTS_DIR, "market_day_table")
+        features_flags = read_output(OUTPUTS_DIR, "features_and_flags")
     except FileNotFoundError as e:
         print(f"Warning: Could not load data files - {e}")
+    # memory-mapped: opening is cheap and pages are shared with other workers
+    if PanelStore.exists(PANEL_DIR):
+        panel = PanelStore(PANEL_DIR)
 
 @app.on_event("startup")
 async def startup_event():
@@ -90,6 +101,15 @@ class AnalyzeRequest(BaseModel):
     volz_threshold: float = 2.5
     range_pct_threshold: float = 95.0
 
+class SweepRequest(BaseModel):
+    ret_z: List[float] = [2.0, 2.5, 3.0]
+    volz: List[float] = [2.0, 2.5, 3.0]
+    range_pct: List[float] = [90.0, 95.0, 99.0]
+    by: Optional[str] = None  # ticker, month or type
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    tickers: Optional[List[str]] = None
+
 # ============== API ENDPOINTS ==============
 
 @app.get("/", response_class=HTMLResponse)
@@ -451,6 +471,31 @@ async def get_market_days(
     
     return df.to_dict(orient="records")
 
+@app.get("/api/prices/{ticker}")
+async def get_prices(
+    ticker: str,
+    field: str = Query("close", description=f"One of {', '.join(PANEL_FIELDS)}"),
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+):
+    """Get one ticker's price/volume series from the panel store"""
+    if panel is None:
+        raise HTTPException(status_code=500, detail="Panel not loaded")
+    if field not in PANEL_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Unknown field: {field}")
+    try:
+        dates, values = panel.series(ticker.upper(), field, start_date, end_date)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Ticker not found: {ticker}")
+
+    keep = ~np.isnan(values)
+    return {
+        "ticker": ticker.upper(),
+        "field": field,
+        "dates": np.datetime_as_string(dates[keep], unit="D").tolist(),
+        "values": values[keep].tolist(),
+    }
+
 @app.get("/api/tickers")
 async def get_tickers():
     """Get list of available tickers"""
@@ -573,6 +618,31 @@ async def analyze(request: AnalyzeRequest):
         "sample_anomalies": flagged.head(20).fillna("").to_dict(orient="records")
     }
 
+@app.post("/api/sweep")
+async def sweep(request: SweepRequest):
+    """Flag counts for every combination of the given threshold grids, in one pass"""
+    if features_flags is None:
+        raise HTTPException(status_code=500, detail="Data not loaded")
+    if request.by is not None and request.by not in SWEEP_BY:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(SWEEP_BY)}")
+    if not (request.ret_z and request.volz and request.range_pct):
+        raise HTTPException(status_code=400, detail="Threshold grids must not be empty")
+
+    df = features_flags
+    if request.start_date:
+        df = df[df["date"] >= request.start_date]
+    if request.end_date:
+        df = df[df["date"] <= request.end_date]
+    if request.tickers:
+        df = df[df["ticker"].isin([t.upper() for t in request.tickers])]
+
+    res = sweep_thresholds(df, request.ret_z, request.volz, request.range_pct, by=request.by)
+    return {
+        "total_rows_analyzed": len(df),
+        "combinations": len(set(request.ret_z)) * len(set(request.volz)) * len(set(request.range_pct)),
+        "results": res.to_dict(orient="records"),
+    }
+
 @app.get("/api/report/download")
 async def download_report():
     """Download a combined PDF report with all analysis data in table format"""
@@ -590,9 +660,9 @@ async def download_report():
     from reportlab.graphics import renderPDF
 
     try:
-        df_anomaly = pd.read_csv(os.path.join(OUTPUTS_DIR, "daily_anomaly_card.csv"))
-        df_market = pd.read_csv(os.path.join(OUTPUTS_DIR, "market_day_table.csv"))
-        df_features = pd.read_csv(os.path.join(OUTPUTS_DIR, "features_and_flags.csv"))
+        df_anomaly = read_output(OUTPUTS_DIR, "daily_anomaly_card")
+        df_market = read_output(OUTPUTS_DIR, "market_day_table")
+        df_features = read_output(OUTPUTS_DIR, "features_and_flags")
     except FileNotFoundError as e:
         raise HTTPException(status_code=500, detail=f"Data files not found: {e}")
 
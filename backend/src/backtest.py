@@ -0,0 +1,111 @@
+from __future__ import annotations
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_start_method, resource_tracker, shared_memory
+from typing import Callable
+import numpy as np
+import pandas as pd
+from .profiling import record, stage
+
+@dataclass(frozen=True)
+class Fold:
+    """One walk-forward step over date-sorted rows: fit on rows [0, hist_end),
+    score the rows in `block` (all in one month, all dated after the history)."""
+    month: str
+    hist_end: int
+    block: np.ndarray  # row indices, ascending
+
+def month_folds(dates: np.ndarray, score_mask: np.ndarray, min_history: int = 0) -> list[Fold]:
+    """Monthly expanding-window folds over date-sorted rows.
+
+    Month boundaries come from one searchsorted over the sorted dates. A
+    month's history is every row dated before its first scored row; months
+    with fewer than `min_history` history rows are skipped.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    if len(dates) == 0:
+        return []
+    months = np.arange(dates[0].astype("datetime64[M]"), dates[-1].astype("datetime64[M]") + 2)
+    bounds = np.searchsorted(dates, months.astype("datetime64[D]"), side="left")
+    folds = []
+    for m, lo, hi in zip(months[:-1], bounds[:-1], bounds[1:]):
+        block = lo + np.flatnonzero(score_mask[lo:hi])
+        if len(block) == 0:
+            continue
+        hist_end = int(np.searchsorted(dates, dates[block[0]], side="left"))
+        if hist_end < min_history:
+            continue
+        folds.append(Fold(str(m), hist_end, block))
+    return folds
+
+_shm: shared_memory.SharedMemory | None = None
+_X: np.ndarray | None = None  # the worker's view of the shared matrix
+
+def _attach(name: str, shape: tuple, dtype: str) -> None:
+    global _X, _shm
+    _shm = shared_memory.SharedMemory(name=name)
+    if get_start_method() != "fork":
+        # the parent owns and unlinks the block; a spawned worker has its own
+        # resource tracker, which would otherwise unlink it when the worker exits
+        resource_tracker.unregister(_shm._name, "shared_memory")
+    _X = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_shm.buf)
+
+def _run_fold(fn: Callable, hist_end: int, block: np.ndarray, params: dict) -> tuple[np.ndarray, float, float]:
+    t0, c0 = time.perf_counter(), time.process_time()
+    out = np.asarray(fn(_X[:hist_end], _X[block], **params))
+    return out, time.perf_counter() - t0, time.process_time() - c0
+
+def run_folds(
+    fn: Callable[..., np.ndarray],
+    X: np.ndarray,
+    folds: list[Fold],
+    workers: int = 1,
+    fill=-999,
+    dtype=int,
+    **params,
+) -> np.ndarray:
+    """Apply fn(X_hist, X_block, **params) -> per-row output to every fold.
+
+    Returns an array over all rows of X (`fill` where no fold scored the
+    row). With workers > 1 the folds run in a process pool that reads X from
+    one shared-memory block; fn must be a module-level function. Results are
+    written back by fold, so the output does not depend on completion order.
+    """
+    out = np.full(len(X), fill, dtype=dtype)
+    if workers <= 1 or len(folds) <= 1:
+        for f in folds:
+            with stage(f"{fn.__name__} {f.month}", len(f.block)) as rec:
+                rec["hist_rows"] = f.hist_end
+                out[f.block] = fn(X[:f.hist_end], X[f.block], **params)
+        return out
+
+    X = np.ascontiguousarray(X)
+    shm = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+    try:
+        np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[:] = X
+        # largest folds first so the longest fits don't start last
+        order = sorted(range(len(folds)), key=lambda i: -folds[i].hist_end)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(shm.name, X.shape, X.dtype.str)) as ex:
+            futures = {i: ex.submit(_run_fold, fn, folds[i].hist_end, folds[i].block, params) for i in order}
+            for i, f in enumerate(folds):
+                out[f.block], wall, cpu = futures[i].result()
+                record(f"{fn.__name__} {f.month}", wall, cpu, len(f.block), hist_rows=f.hist_end, worker=True)
+    finally:
+        shm.close()
+        shm.unlink()
+    return out
+
+def history_drift(folds: list[Fold], base: np.ndarray, other: np.ndarray, noise: int = -1) -> pd.DataFrame:
+    """Per-fold anomaly (noise label) rate of two run_folds() outputs, e.g. a
+    bounded-history run against the full-history baseline."""
+    rows = []
+    for f in folds:
+        a, b = base[f.block] == noise, other[f.block] == noise
+        rows.append({
+            "month": f.month, "hist_rows": f.hist_end, "rows": len(f.block),
+            "rate_full": a.mean(), "rate_bounded": b.mean(), "drift": b.mean() - a.mean(),
+            "agree": (a == b).mean(),
+        })
+    return pd.DataFrame(rows, columns=["month","hist_rows","rows","rate_full","rate_bounded","drift","agree"])
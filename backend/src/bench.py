@@ -0,0 +1,130 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import pandas as pd
+from .synthetic import SYNTH_META, generate_market, synthetic_tickers
+from .sweep import parse_grid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# stages reported per run (profile.json names; a stage that runs more than once is summed)
+BENCH_STAGES = ["load_universe", "compute_features", "compute_features.ret_z", "compute_features.volz",
+                "compute_features.range_pct", "detect_rule_based", "compute_market_table", "kmeans_fit",
+                "kmeans", "dbscan", "build_daily_anomaly_card"]
+CLUSTER_START = "2018-01-01"  # walkforward trains clustering on 2018
+
+def ensure_dataset(root: str, n_tickers: int, years: float, seed: int) -> str:
+    """Synthetic data dir for (n_tickers, years, seed), generated once and reused."""
+    path = os.path.join(root, f"t{n_tickers}_y{years:g}_s{seed}")
+    meta = os.path.join(path, SYNTH_META)
+    if os.path.exists(meta):
+        with open(meta) as f:
+            m = json.load(f)
+        if (m["tickers"], m["years"], m["seed"]) == (n_tickers, years, seed):
+            return path
+    generate_market(path, n_tickers, years, seed=seed)
+    return path
+
+def run_walkforward(data_dir: str, tickers: list[str], out_dir: str, methods: str, timeout: float | None,
+                    extra: list[str] | None = None) -> dict:
+    """One walkforward run in a fresh process (so peak RSS is its own);
+    returns its profile.json plus status and wall time."""
+    cmd = [sys.executable, "-m", "src.walkforward", "--data-dir", data_dir, "--universe", ",".join(tickers),
+           "--out-dir", out_dir, "--methods", methods, "--profile", "--output-format", "csv", *(extra or [])]
+    t0 = time.perf_counter()
+    try:
+        proc = subprocess.run(cmd, cwd=BACKEND_DIR, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"status": "timeout", "wall": time.perf_counter() - t0}
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        return {"status": "error", "wall": wall, "error": proc.stderr.strip().splitlines()[-1:]}
+    with open(os.path.join(out_dir, "profile.json")) as f:
+        return {"status": "ok", "wall": wall, "profile": json.load(f)}
+
+def stage_rows(profile: dict) -> list[dict]:
+    """Per-stage totals of one profile (a stage can run more than once)."""
+    out = {}
+    for s in profile["stages"]:
+        name = s["stage"]
+        if name not in BENCH_STAGES:
+            continue
+        r = out.setdefault(name, {"stage": name, "wall": 0.0, "cpu": 0.0, "rows": 0, "peak_rss_delta_mb": 0.0})
+        r["wall"] += s["wall"]
+        r["cpu"] += s["cpu"]
+        r["rows"] += s["rows"] or 0
+        r["peak_rss_delta_mb"] += s["peak_rss_delta_mb"] or 0.0
+    return list(out.values())
+
+def run_suite(
+    tickers: list[int], years: list[float], methods: str, data_root: str, out_dir: str,
+    seed: int = 0, timeout: float | None = None, extra: list[str] | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Time walkforward over every (tickers, years) pair on synthetic data.
+
+    Returns (runs, stages): one row per run with total wall time, feature rows,
+    throughput and peak RSS, and one row per run and stage. Clustering methods
+    are dropped for spans that don't reach back to 2018 (no training rows).
+    """
+    runs, stages = [], []
+    for y in years:
+        for n in tickers:
+            data_dir = ensure_dataset(data_root, n, y, seed)
+            start = pd.bdate_range(end="2020-06-30", periods=max(int(round(y * 252)), 2))[0]
+            m = methods if start <= pd.Timestamp(CLUSTER_START) else "rule"
+            res = run_walkforward(data_dir, synthetic_tickers(n), os.path.join(out_dir, "run"), m, timeout, extra)
+            row = {"tickers": n, "years": y, "methods": m, "status": res["status"], "wall": res["wall"]}
+            if res["status"] == "ok":
+                prof = res["profile"]
+                per_stage = stage_rows(prof)
+                feat_rows = next((s["rows"] for s in per_stage if s["stage"] == "compute_features"), 0)
+                row.update(rows=feat_rows, pipeline_wall=prof["total_wall"], peak_rss_mb=prof["peak_rss_mb"],
+                           rows_per_s=feat_rows / prof["total_wall"] if prof["total_wall"] else None)
+                # per-stage throughput in panel rows, whatever the stage returns (centers, cards, ...)
+                for s in per_stage:
+                    stages.append({"tickers": n, "years": y, **s,
+                                   "rows_per_s": feat_rows / s["wall"] if s["wall"] else None})
+            runs.append(row)
+            print(f"{n:>6} tickers x {y:>4g} years [{m}]: {res['status']} in {res['wall']:.1f}s"
+                  + (f", {row['rows']} rows, {row['rows_per_s']:,.0f} rows/s, peak {row['peak_rss_mb']:.0f} MB"
+                     if res["status"] == "ok" else ""))
+    return pd.DataFrame(runs), pd.DataFrame(stages)
+
+def curves(runs: pd.DataFrame, stages: pd.DataFrame) -> pd.DataFrame:
+    """Wide table for plotting: one row per (tickers, years) with end-to-end
+    and per-stage throughput (rows/s) and peak RSS."""
+    ok = runs[runs["status"] == "ok"]
+    out = ok[["tickers", "years", "rows", "rows_per_s", "peak_rss_mb"]]
+    if len(stages):
+        wide = stages.pivot_table(index=["tickers", "years"], columns="stage", values="rows_per_s")
+        wide.columns = [f"{c}_rows_per_s" for c in wide.columns]
+        out = out.merge(wide.reset_index(), on=["tickers", "years"], how="left")
+    return out.sort_values(["years", "tickers"]).reset_index(drop=True)
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark walkforward on synthetic markets across universe sizes and history lengths.")
+    p.add_argument("--tickers", default="10,100,1000,5000", help="Universe sizes: '10,100' or 'start:stop:step'.")
+    p.add_argument("--years", default="1,5,10,30", help="History lengths in years.")
+    p.add_argument("--methods", default="rule,kmeans", help="walkforward --methods (dbscan is quadratic in history; add it for small grids).")
+    p.add_argument("--data-root", default="data/bench", help="Where synthetic datasets are generated (and reused).")
+    p.add_argument("--out-dir", default="outputs/bench", help="Where bench_runs.csv, bench_stages.csv and bench_curves.csv go.")
+    p.add_argument("--seed", type=int, default=0, help="Synthetic data seed.")
+    p.add_argument("--timeout", type=float, default=None, help="Seconds before a run is recorded as a timeout.")
+    p.add_argument("--walkforward-args", default="", help="Extra walkforward flags for every run, e.g. '--lean --cache-dir cache'.")
+    args = p.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    runs, stages = run_suite(
+        [int(t) for t in parse_grid(args.tickers)], parse_grid(args.years), args.methods,
+        args.data_root, args.out_dir, seed=args.seed, timeout=args.timeout, extra=args.walkforward_args.split(),
+    )
+    for name, df in (("bench_runs", runs), ("bench_stages", stages), ("bench_curves", curves(runs, stages))):
+        path = os.path.join(args.out_dir, f"{name}.csv")
+        df.to_csv(path, index=False)
+        print(f"Wrote: {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from .config import Windows, Thresholds
+from .io_utils import append_pickle, index_data_dir, load_universe, read_pickles
+from .features import compute_features
+from .detectors_rule import detect_rule_based
+from .market import MarketAccumulator
+from .reporting import build_daily_anomaly_card
+from .store import StoreWriter
+from .profiling import stage, timed
+
+# peak working set of load -> features -> rules per byte of CSV (measured ~4.3
+# on the Kaggle files, float64 features)
+MEM_PER_CSV_BYTE = 5
+
+def plan_batches(data_dir: str, tickers: list[str], budget_mb: float) -> list[list[str]]:
+    """Contiguous runs of the sorted universe whose estimated working set
+    (CSV size * MEM_PER_CSV_BYTE) fits in `budget_mb`. A ticker larger than the
+    budget on its own still gets a batch."""
+    index = index_data_dir(data_dir)
+    budget = budget_mb * 2**20
+    batches, cur, size = [], [], 0.0
+    for t in sorted(tickers):
+        b = os.path.getsize(index[t]) * MEM_PER_CSV_BYTE if t in index else 0
+        # duplicates stay together so each batch sees a ticker's full history
+        if cur and size + b > budget and t != cur[-1]:
+            batches.append(cur)
+            cur, size = [], 0.0
+        cur.append(t)
+        size += b
+    if cur:
+        batches.append(cur)
+    return batches
+
+def run_chunked(
+    data_dir: str,
+    tickers: list[str],
+    out_dir: str,
+    budget_mb: float,
+    windows: Windows | None = None,
+    thr: Thresholds | None = None,
+    weights: list[str] | None = None,
+    lean: bool = False,
+    cache_dir: str | None = None,
+    csv: bool = True,
+    writer: StoreWriter | None = None,
+) -> dict:
+    """Rule-only walkforward that never holds more than one ticker batch.
+
+    Each batch (see plan_batches) is loaded, featurized and rule-flagged, then
+    appended to features_and_flags.csv (batches follow the sorted universe, so
+    rows keep the (ticker, date) order of a full run) and reduced to per-date
+    market sums. Daily card rows go to one spill file per month; at the end
+    each month is read back alone, sorted by (date, ticker) and appended to
+    daily_anomaly_card.csv. Memory is bounded by one batch plus one month of
+    card rows plus one row of sums per date.
+
+    With `writer`, the same frames are appended to the columnar store (the
+    caller publishes it); `csv` False skips the CSVs.
+
+    The outputs equal a full in-memory run, except that market sums added
+    across batches can differ from a single groupby in the last bits.
+    """
+    if windows is None:
+        windows = Windows()
+    if thr is None:
+        thr = Thresholds()
+    batches = plan_batches(data_dir, tickers, budget_mb)
+    feat_path = os.path.join(out_dir, "features_and_flags.csv")
+    card_path = os.path.join(out_dir, "daily_anomaly_card.csv")
+    spill = os.path.join(out_dir, "_card_months")
+    shutil.rmtree(spill, ignore_errors=True)
+    os.makedirs(spill)
+
+    market = MarketAccumulator(weights)
+    rows = 0
+    for i, batch in enumerate(batches):
+        cache = os.path.join(cache_dir, f"batch{i}of{len(batches)}") if cache_dir else None
+        raw = timed("load_universe", lambda: load_universe(data_dir, batch, cache_dir=cache))
+        if lean:
+            raw["ticker"] = raw["ticker"].astype("category")
+        feat = timed("compute_features", lambda: compute_features(raw, windows=windows, float_dtype=np.float32 if lean else np.float64))
+        del raw
+        with stage("market sums", len(feat)):
+            market.add(feat)
+        det = timed("detect_rule_based", lambda: detect_rule_based(feat, thr=thr))
+        del feat
+        with stage("write features_and_flags", len(det)):
+            if csv:
+                det.to_csv(feat_path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+            if writer:
+                writer.append("features_and_flags", det)
+        card = timed("build_daily_anomaly_card", lambda: build_daily_anomaly_card(det, method="rule", thr=thr))
+        month = card["date"].astype(str).str[:7].to_numpy()
+        for m in np.unique(month):
+            append_pickle(os.path.join(spill, f"{m}.pkl"), card[month == m])
+        rows += len(det)
+        print(f"batch {i + 1}/{len(batches)}: {len(batch)} tickers, {len(det)} rows")
+        del det, card
+
+    for j, name in enumerate(sorted(os.listdir(spill))):
+        with stage(f"write daily_anomaly_card {name[:-4]}") as rec:
+            parts = read_pickles(os.path.join(spill, name))
+            card = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+            card = card.assign(date=card["date"].astype(str)).sort_values(["date", "ticker"], kind="stable")
+            rec["rows"] = len(card)
+            if csv:
+                card.to_csv(card_path, index=False, mode="w" if j == 0 else "a", header=j == 0)
+            if writer:
+                writer.append("daily_anomaly_card", card)
+    shutil.rmtree(spill)
+
+    market_table = timed("compute_market_table", lambda: market.table(windows, thr))
+    if csv:
+        market_table.to_csv(os.path.join(out_dir, "market_day_table.csv"), index=False)
+    if writer:
+        writer.append("market_day_table", market_table)
+    return {"batches": len(batches), "rows": rows, "dates": len(market_table)}
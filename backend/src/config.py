@@ -6,6 +6,13 @@ class Windows:
     w_volume: int = 21
     w_range: int = 63
 
+@dataclass(frozen=True)
+class FeatureBank:
+    """Several windows per feature, computed in one pass by compute_feature_bank."""
+    w_return: tuple[int, ...] = (21, 63, 126, 252)
+    w_volume: tuple[int, ...] = (10, 21, 63)
+    w_range: tuple[int, ...] = (21, 63, 126)
+
 @dataclass(frozen=True)
 class Thresholds:
     ret_z: float = 2.5
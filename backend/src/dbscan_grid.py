@@ -0,0 +1,94 @@
+from __future__ import annotations
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy.sparse.csgraph import connected_components
+from sklearn.neighbors import radius_neighbors_graph
+from sklearn.preprocessing import StandardScaler
+from .detectors_dbscan import bound_history
+from .sweep import parse_grid
+from .store import read_output
+
+FEATURES = ["ret_z","volz","range_pct"]
+
+def split_masks(dates: pd.Series) -> dict[str, np.ndarray]:
+    # same split as walkforward: Train=2018, Val=2019, Test=2020-Q1
+    d = pd.to_datetime(dates)
+    return {
+        "train": (d.dt.year == 2018).to_numpy(),
+        "val": (d.dt.year == 2019).to_numpy(),
+        "test": ((d >= "2020-01-01") & (d <= "2020-03-31")).to_numpy(),
+    }
+
+def dbscan_grid(
+    X: np.ndarray, eps: list[float], min_samples: list[int], weight: np.ndarray | None = None
+) -> pd.DataFrame:
+    """Noise rate and cluster count of DBSCAN for every (eps, min_samples).
+
+    The radius-neighbours graph is built once at max(eps); each eps keeps the
+    edges no longer than it. DBSCAN's outcome is then read off the graph
+    directly: core points have neighbourhood weight (self included) >=
+    min_samples, clusters are the connected components of core-core edges and
+    noise is every non-core point without a core neighbour -- the same noise
+    set and cluster count DBSCAN(eps, min_samples) gives on X. (Running
+    DBSCAN(metric="precomputed") on the cached graph instead was slower than
+    refitting from scratch.)
+    """
+    eps = sorted(set(eps))
+    n = len(X)
+    w = np.ones(n) if weight is None else np.asarray(weight, dtype=float)
+    graph = radius_neighbors_graph(X, radius=eps[-1], mode="distance") if n else None
+    rows = []
+    for e in eps:
+        if n:
+            adj = graph.copy()
+            adj.data = (adj.data <= e).astype(np.float64)  # float64: csgraph won't copy it
+            adj.eliminate_zeros()
+            mass = adj @ w + w
+        for m in sorted(set(min_samples)):
+            if not n:
+                rows.append({"eps": e, "min_samples": m, "rows": 0, "noise_rate": np.nan, "n_clusters": 0})
+                continue
+            core = mass >= m
+            # the graph is symmetric, so strong components are the connected
+            # ones, and cheaper to get than directed=False
+            n_clusters = connected_components(adj[core][:, core], connection="strong")[0] if core.any() else 0
+            noise = ~core & (adj @ core.astype(np.float64) == 0)
+            rows.append({
+                "eps": e, "min_samples": m, "rows": n,
+                "noise_rate": float(noise.mean()), "n_clusters": int(n_clusters),
+            })
+    return pd.DataFrame(rows, columns=["eps","min_samples","rows","noise_rate","n_clusters"])
+
+def main():
+    p = argparse.ArgumentParser(description="DBSCAN eps/min_samples grid search from one cached neighbour graph per split.")
+    p.add_argument("--out-dir", default="outputs", help="Folder containing features_and_flags.csv or the output store")
+    p.add_argument("--eps", default="0.5:1.2:0.1", help="eps values: '0.7,0.9' or 'start:stop:step'.")
+    p.add_argument("--min-samples", default="5,10,15,20,30", help="min_samples values.")
+    p.add_argument("--max-rows", type=int, default=None, help="Fit each split on a weighted sample of at most this many rows.")
+    args = p.parse_args()
+
+    feat = read_output(args.out_dir, "features_and_flags", columns=["date"] + FEATURES)
+    feat = feat.dropna(subset=FEATURES).sort_values("date", kind="stable")
+    splits = split_masks(feat["date"])
+    X = feat[FEATURES].to_numpy(dtype=float)
+    X = StandardScaler().fit(X[splits["train"]]).transform(X)
+
+    eps, min_samples = parse_grid(args.eps), [int(m) for m in parse_grid(args.min_samples)]
+    frames = []
+    for name, mask in splits.items():
+        t0 = time.perf_counter()
+        X_split, weight = bound_history(X[mask], "sample", args.max_rows)
+        res = dbscan_grid(X_split, eps, min_samples, weight)
+        frames.append(res.assign(split=name))
+        print(f"{name}: {len(res)} combinations on {len(X_split)} rows in {time.perf_counter() - t0:.1f}s")
+    out = pd.concat(frames, ignore_index=True)[["split","eps","min_samples","rows","noise_rate","n_clusters"]]
+
+    out_path = os.path.join(args.out_dir, "dbscan_grid.csv")
+    out.to_csv(out_path, index=False)
+    print(f"Wrote: {out_path}")
+
+if __name__ == "__main__":
+    main()
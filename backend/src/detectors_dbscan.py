@@ -1,8 +1,97 @@
 from __future__ import annotations
+from dataclasses import dataclass
 import numpy as np
 from sklearn.cluster import DBSCAN
+from sklearn.neighbors import KDTree
+from .registry import ModelRegistry, data_fingerprint
 
-def fit_dbscan(X: np.ndarray, eps: float, min_samples: int) -> DBSCAN:
+HISTORY_MODES = ["full", "window", "sample"]
+
+def fit_dbscan(X: np.ndarray, eps: float, min_samples: int, sample_weight: np.ndarray | None = None) -> DBSCAN:
     model = DBSCAN(eps=eps, min_samples=min_samples)
-    model.fit(X)
+    model.fit(X, sample_weight=sample_weight)
     return model
+
+def bound_history(X_hist: np.ndarray, mode: str = "full", max_rows: int | None = None) -> tuple[np.ndarray, np.ndarray | None]:
+    """Cap the fit set of an expanding-window fold at max_rows (rows are date-sorted).
+
+    full:   the whole history, no weights.
+    window: the most recent max_rows rows (sliding window).
+    sample: a uniform subsample of max_rows rows, each weighted n/max_rows.
+            DBSCAN counts weights towards min_samples, so expected
+            neighbourhood mass -- the density structure -- is preserved.
+            Seeded by the history size, so a fold always draws the same rows.
+    """
+    if mode not in HISTORY_MODES:
+        raise ValueError(f"unknown history mode {mode!r} (use {', '.join(HISTORY_MODES)})")
+    n = len(X_hist)
+    if mode == "full" or max_rows is None or n <= max_rows:
+        return X_hist, None
+    if mode == "window":
+        return X_hist[n - max_rows:], None
+    idx = np.sort(np.random.default_rng(n).choice(n, size=max_rows, replace=False))
+    return X_hist[idx], np.full(max_rows, n / max_rows)
+
+@dataclass
+class DbscanModel:
+    """What a fitted DBSCAN keeps for later use: its core samples and their
+    cluster labels (storable in the model registry)."""
+    core_samples: np.ndarray  # (n_core, n_features)
+    core_labels: np.ndarray   # (n_core,)
+    eps: float
+    min_samples: int
+
+    @classmethod
+    def from_fitted(cls, model: DBSCAN) -> "DbscanModel":
+        return cls(
+            core_samples=model.components_,
+            core_labels=model.labels_[model.core_sample_indices_],
+            eps=float(model.eps),
+            min_samples=int(model.min_samples),
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {"core_samples": self.core_samples, "core_labels": self.core_labels,
+                "eps": np.array(self.eps), "min_samples": np.array(self.min_samples)}
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Label new points against the fitted clusters without refitting.
+
+        A point within eps of a core sample joins that core's cluster (the
+        nearest one if several clusters are in reach), like a border point in
+        DBSCAN; anything else is noise (-1). New points never become core
+        points themselves, so a dense cluster made only of new points stays
+        noise, where refitting on history + new points could have made it a
+        cluster.
+        """
+        if len(X) == 0 or len(self.core_samples) == 0:
+            return np.full(len(X), -1, dtype=int)
+        dist, idx = KDTree(self.core_samples).query(X, k=1)
+        return np.where(dist[:, 0] <= self.eps, self.core_labels[idx[:, 0]], -1).astype(int)
+
+    @classmethod
+    def from_arrays(cls, a: dict[str, np.ndarray]) -> "DbscanModel":
+        return cls(a["core_samples"], a["core_labels"], float(a["eps"]), int(a["min_samples"]))
+
+def dbscan_fold(
+    X_hist: np.ndarray, X_block: np.ndarray, eps: float, min_samples: int,
+    model_dir: str | None = None, reg_params: dict | None = None,
+    history: str = "full", max_history: int | None = None,
+) -> np.ndarray:
+    """Walk-forward step (see backtest.run_folds): fit on the (optionally
+    bounded, see bound_history) history, or load that fit from the model
+    registry, and label the block with predict()."""
+    X_fit, weight = bound_history(X_hist, history, max_history)
+    registry = ModelRegistry(model_dir) if model_dir else None
+    params = {**(reg_params or {}), "eps": eps, "min_samples": min_samples,
+              "hist": data_fingerprint(X_fit)} if registry else None
+    if registry and X_fit is not X_hist:
+        params["bounded"] = [history, max_history]
+    saved = registry.load("dbscan", params) if registry else None
+    if saved is not None:
+        model = DbscanModel.from_arrays(saved)
+    else:
+        model = DbscanModel.from_fitted(fit_dbscan(X_fit, eps=eps, min_samples=min_samples, sample_weight=weight))
+        if registry:
+            registry.save("dbscan", params, model.to_arrays())
+    return model.predict(X_block)
@@ -1,30 +1,71 @@
 from __future__ import annotations
+from typing import Iterable
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 
 def fit_kmeans_train(X_train: np.ndarray, k: int, random_state: int = 42) -> KMeans:
     km = KMeans(n_clusters=k, n_init="auto", random_state=random_state)
     km.fit(X_train)
     return km
 
-def kmeans_distance_to_centroid(km: KMeans, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+def iter_chunks(X: np.ndarray, chunk_size: int) -> Iterable[np.ndarray]:
+    for i in range(0, len(X), chunk_size):
+        yield X[i:i + chunk_size]
+
+def fit_kmeans_minibatch(
+    chunks: Iterable[np.ndarray], k: int, random_state: int = 42, batch_size: int = 4096
+) -> MiniBatchKMeans:
+    """Streamed training: one partial_fit per chunk, so only a chunk (plus the
+    k centers) has to be in memory. Chunks smaller than k are buffered until
+    the first update has enough rows to initialise the centers."""
+    km = MiniBatchKMeans(n_clusters=k, random_state=random_state, batch_size=batch_size, n_init=3)
+    pending = []
+    for X in chunks:
+        pending.append(X)
+        if sum(len(p) for p in pending) >= k:
+            km.partial_fit(np.vstack(pending))
+            pending = []
+    if pending:
+        if not hasattr(km, "cluster_centers_"):
+            raise ValueError(f"minibatch KMeans needs at least k={k} training rows")
+        km.partial_fit(np.vstack(pending))
+    return km
+
+def nearest_centroid(centers: np.ndarray, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(cluster_id, distance) of each row's nearest center; works from stored
+    centers alone, so a registry model scores without the sklearn object."""
+    best = np.full(len(X), np.inf)
+    labels = np.zeros(len(X), dtype=np.int32)
+    for c, center in enumerate(centers):
+        d2 = ((X - center) ** 2).sum(axis=1)
+        closer = d2 < best
+        best[closer] = d2[closer]
+        labels[closer] = c
+    return labels, np.linalg.norm(X - centers[labels], axis=1)
+
+def kmeans_distance_to_centroid(km: KMeans | MiniBatchKMeans, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     # returns (cluster_id, distance)
-    labels = km.predict(X)
-    centers = km.cluster_centers_[labels]
-    d = np.linalg.norm(X - centers, axis=1)
-    return labels, d
-
-def per_cluster_thresholds(train_labels: np.ndarray, train_d: np.ndarray, q: float) -> dict[int, float]:
-    thr = {}
-    for c in np.unique(train_labels):
-        ds = train_d[train_labels == c]
-        thr[int(c)] = float(np.percentile(ds, q))
+    return nearest_centroid(km.cluster_centers_, X)
+
+def per_cluster_thresholds(train_labels: np.ndarray, train_d: np.ndarray, q: float, n_clusters: int | None = None) -> np.ndarray:
+    """q-th percentile of train distances per cluster, as an array indexed by
+    cluster id (inf for clusters with no training rows).
+
+    Distances are grouped once with a stable integer sort on the labels; each
+    cluster's percentile is then taken on its contiguous slice instead of
+    masking the full array per cluster.
+    """
+    if n_clusters is None:
+        n_clusters = int(train_labels.max()) + 1 if len(train_labels) else 0
+    order = np.argsort(train_labels, kind="stable")
+    d = train_d[order]
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(train_labels, minlength=n_clusters))])
+    thr = np.full(n_clusters, np.inf)
+    for c in range(n_clusters):
+        if bounds[c + 1] > bounds[c]:
+            thr[c] = np.percentile(d[bounds[c]:bounds[c + 1]], q)
     return thr
 
-def flag_kmeans(labels: np.ndarray, dists: np.ndarray, thr_by_cluster: dict[int, float]) -> np.ndarray:
-    out = np.zeros_like(dists, dtype=int)
-    for i, (c, d) in enumerate(zip(labels, dists)):
-        t = thr_by_cluster.get(int(c), np.inf)
-        out[i] = int(d > t)
-    return out
+def flag_kmeans(labels: np.ndarray, dists: np.ndarray, thr_by_cluster: np.ndarray) -> np.ndarray:
+    return (dists > np.take(thr_by_cluster, labels)).astype(np.int8)
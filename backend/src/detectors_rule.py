@@ -3,45 +3,58 @@ import numpy as np
 import pandas as pd
 from .config import Thresholds
 
+# rule_mask bits: which thresholds a row crossed
+RULE_RET, RULE_VOL, RULE_RNG = 1, 2, 4
+
 def detect_rule_based(df_feat: pd.DataFrame, thr: Thresholds | None = None) -> pd.DataFrame:
     """Rule-based detector per PDF:
-    anomaly if |ret_z|>2.5 or volz>2.5 or range_pct>95, with type labels crash/spike/volume_shock.
+    anomaly if |ret_z|>2.5 or volz>2.5 or range_pct>95.
+
+    Adds anomaly_flag_rule and rule_mask (RULE_* bits of the triggers that
+    fired); rule_type_labels / rule_why_labels turn the mask into text.
     """
     if thr is None:
         thr = Thresholds()
 
-    df = df_feat.copy()
     # Only score rows with full history
-    df = df[df["has_history"]].copy()
+    df = df_feat[df_feat["has_history"]]
 
     trig_ret = df["ret_z"].abs() > thr.ret_z
     trig_vol = df["volz"] > thr.volz
     trig_rng = df["range_pct"] > thr.range_pct
 
-    df["anomaly_flag_rule"] = (trig_ret | trig_vol | trig_rng).astype(int)
+    mask = trig_ret.to_numpy() * RULE_RET | trig_vol.to_numpy() * RULE_VOL | trig_rng.to_numpy() * RULE_RNG
+    df["rule_mask"] = mask.astype(np.int8)
+    df["anomaly_flag_rule"] = (mask != 0).astype(np.int8)
+    return df
 
-    # type label
-    types = []
-    for r, rz, vz, fr in zip(df["ret"], df["ret_z"], df["volz"], df["anomaly_flag_rule"]):
-        t = []
-        if fr != 1:
-            types.append("")
+def _lookup(names: list[str], codes: np.ndarray) -> pd.Categorical:
+    # per-code labels -> categorical without building a string per row
+    cats = sorted(set(names))
+    lut = np.array([cats.index(n) for n in names], dtype=np.int8)
+    return pd.Categorical.from_codes(lut[codes], cats)
+
+def rule_type_labels(mask, ret) -> pd.Categorical:
+    """Type label per row from rule_mask and the sign of ret: crash/spike for
+    the return trigger, volume_shock, range_spike when only the range fired."""
+    names = []
+    for code in range(16):
+        if not code & 7:
+            names.append("")
             continue
-        if pd.notna(rz) and abs(rz) > thr.ret_z:
-            t.append("crash" if (r is not None and r < 0) else "spike")
-        if pd.notna(vz) and vz > thr.volz:
+        t = []
+        if code & RULE_RET:
+            t.append("crash" if code & 8 else "spike")
+        if code & RULE_VOL:
             t.append("volume_shock")
-        types.append(" + ".join(t) if t else "range_spike")
-    df["type_rule"] = types
-
-    # why
-    why = []
-    for a, b, c in zip(trig_ret, trig_vol, trig_rng):
-        reasons = []
-        if a: reasons.append("|ret_z| > 2.5")
-        if b: reasons.append("volz > 2.5")
-        if c: reasons.append("range_pct > 95")
-        why.append("; ".join(reasons))
-    df["why_rule"] = why
+        names.append(" + ".join(t) if t else "range_spike")
+    neg = np.asarray(ret, dtype=float) < 0
+    return _lookup(names, np.asarray(mask, dtype=np.int64) | neg * 8)
 
-    return df
+def rule_why_labels(mask, thr: Thresholds | None = None) -> pd.Categorical:
+    """Reason text per row from rule_mask, quoting the thresholds actually used."""
+    if thr is None:
+        thr = Thresholds()
+    reasons = [(RULE_RET, f"|ret_z| > {thr.ret_z:g}"), (RULE_VOL, f"volz > {thr.volz:g}"), (RULE_RNG, f"range_pct > {thr.range_pct:g}")]
+    names = ["; ".join(r for bit, r in reasons if code & bit) for code in range(8)]
+    return _lookup(names, np.asarray(mask, dtype=np.int64))
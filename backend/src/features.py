@@ -1,63 +1,222 @@
 from __future__ import annotations
 import numpy as np
 import pandas as pd
-from .config import Windows
+from .config import Windows, FeatureBank
+from .profiling import stage
 
+FEATURE_COLUMNS = [
+    "date", "ticker", "open", "high", "low", "close", "adj_close", "volume",
+    "ret", "ret_z", "ret_mu", "ret_sd", "log_volume", "volz", "range", "range_pct", "has_history",
+]
+# derived float columns; stored as float32 when compute_features(float_dtype=np.float32)
+FLOAT_FEATURES = ["ret", "ret_z", "ret_mu", "ret_sd", "log_volume", "volz", "range", "range_pct"]
+
+# pandas copy-on-write: frames returned by sort_values/reset_index/filters never
+# write through to the caller's frame, so no defensive .copy() is needed here
 def add_returns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df["ret"] = df.groupby("ticker")["adj_close"].pct_change()
-    return df
+    return df.assign(ret=df.groupby("ticker", observed=True)["adj_close"].pct_change())
+
+def panel_prev(x: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """Value of each ticker's previous bar on (D, T) panel columns (PanelStore
+    slices), what a per-ticker shift(1) gives in the long frame; NaN before a
+    ticker's first bar. Computed in float64."""
+    rows = np.arange(len(x))[:, None]
+    last = np.maximum.accumulate(np.where(present, rows, -1), axis=0)
+    prev = np.vstack([np.full((1, x.shape[1]), -1), last[:-1]])
+    out = np.asarray(x, dtype=np.float64)[np.maximum(prev, 0), np.arange(x.shape[1])]
+    out[prev < 0] = np.nan
+    return out
+
+def panel_returns(adj_close: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """add_returns() on (D, T) panel columns: each bar's adj_close over the
+    ticker's previous bar, minus 1; NaN where there is no bar."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret = np.asarray(adj_close, dtype=np.float64) / panel_prev(adj_close, present) - 1
+    ret[~present] = np.nan
+    return ret
 
-def _rolling_zscore(series: pd.Series, window: int) -> tuple[pd.Series, pd.Series, pd.Series]:
-    # shift(1) ensures we only use past data when scoring current day
-    mu = series.shift(1).rolling(window=window, min_periods=window).mean()
-    sd = series.shift(1).rolling(window=window, min_periods=window).std(ddof=0)
-    z = (series - mu) / sd.replace(0, np.nan)
-    return z, mu, sd
+def _window_zscores(x: np.ndarray, windows: list[int]) -> dict[int, np.ndarray]:
+    """z[i] = (x[i] - mean(x[i-w:i])) / std(x[i-w:i]) (ddof=0) for every w in windows.
 
-def _range_percentile_per_ticker(range_series: pd.Series, window: int) -> pd.Series:
-    # range_series is already (high-low)/close
-    x = range_series.to_numpy(dtype=float)
+    Only past data is used (equivalent to shift(1).rolling(w)); any NaN in the
+    window gives NaN and a constant window (zero std) gives NaN. One sweep over
+    lags 1..max(w) accumulates sums and sums of squares of x[i-k] - x[i-1]
+    (shifted data keeps the one-pass variance stable) and each window is read
+    off when the sweep reaches it. Each value depends only on the window
+    contents, not on where the array starts -- the incremental path relies on
+    this to reproduce a full recompute from a window-sized buffer.
+    """
     n = len(x)
-    out = np.full(n, np.nan, dtype=float)
-    for i in range(n):
-        start = i - window
-        end = i  # up to i-1
-        if start < 0:
-            continue
-        past = x[start:end]
-        if np.any(np.isnan(past)) or np.isnan(x[i]):
+    ws = sorted(set(windows))
+    out = {w: np.full(n, np.nan) for w in ws}
+    if n < 2:
+        return out
+    ref = x[:-1]                # x[i-1] for i >= 1
+    s1 = np.zeros(n - 1)        # indexed by i - 1
+    s2 = np.zeros(n - 1)
+    buf = np.empty(n - 1)
+    for k in range(1, min(ws[-1], n - 1) + 1):
+        d = np.subtract(x[:n - k], ref[k - 1:], out=buf[k - 1:])
+        s1[k - 1:] += d
+        s2[k - 1:] += np.multiply(d, d, out=d)
+        if k in out:
+            m1 = s1[k - 1:] / k
+            var = s2[k - 1:] / k - m1 * m1
+            std = np.sqrt(np.where(var > 0, var, np.nan))
+            out[k][k:] = (x[k:] - (ref[k - 1:] + m1)) / std
+    return out
+
+def _window_zscore(x: np.ndarray, window: int) -> np.ndarray:
+    return _window_zscores(x, [window])[window]
+
+# a window whose variance is below this share of its ticker's variance is
+# treated as constant (cancellation in s2/w - m1^2 leaves rounding noise there)
+_CUMSUM_VAR_RTOL = 1e-9
+
+def _window_zscores_cumsum(x: np.ndarray, windows: list[int], starts: np.ndarray) -> dict[int, np.ndarray]:
+    """_window_zscores for many windows at O(n) each, from two shared prefix sums.
+
+    `starts` are the first rows of the (contiguous) tickers. x is centered on
+    its ticker's mean, and its square on the ticker's mean square (added back
+    per window), so both prefix sums wander around 0 instead of growing with
+    the row count and the window differences keep near full precision. Values
+    match the lag sweep to ~1e-12 relative, not bit for bit; rows whose window
+    reaches into the previous ticker are garbage and must be blanked by the
+    caller (_blank_warmup).
+    """
+    n = len(x)
+    out = {w: np.full(n, np.nan) for w in sorted(set(windows))}
+    if n < 2:
+        return out
+    lengths = np.diff(np.append(starts, n))
+    isnan = np.isnan(x)
+    count = np.maximum(np.add.reduceat(~isnan, starts), 1)
+    d = np.where(isnan, 0.0, x)
+    d -= np.repeat(np.add.reduceat(d, starts) / count, lengths)
+    d[isnan] = 0.0
+    sq = d * d
+    msq = np.repeat(np.add.reduceat(sq, starts) / count, lengths)
+    sq -= msq
+    # exclusive prefixes: p[i] = sum over rows before i
+    p1 = np.cumsum(d) - d
+    p2 = np.cumsum(sq) - sq
+    nan_c = np.concatenate([[0], np.cumsum(isnan)])
+    for w in out:
+        if w >= n:
             continue
-        out[i] = (past < x[i]).mean() * 100.0
-    return pd.Series(out, index=range_series.index)
+        m1 = (p1[w:] - p1[:n - w]) / w
+        ms = (p2[w:] - p2[:n - w]) / w + msq[w:]
+        var = ms - m1 * m1
+        std = np.sqrt(np.where(var > _CUMSUM_VAR_RTOL * msq[w:], var, np.nan))
+        # NaN at x[i] or anywhere in x[i-w:i]
+        bad = (nan_c[w + 1:] - nan_c[:n - w]) > 0
+        out[w][w:] = np.where(bad, np.nan, (d[w:] - m1) / std)
+    return out
+
+def _range_percentiles(x: np.ndarray, windows: list[int]) -> dict[int, np.ndarray]:
+    """Percent of x[i-w:i] strictly below x[i] for every w in windows; NaN if x[i]
+    or any value in the window is NaN.
+
+    Same lag sweep as _window_zscores, accumulating counts of past values below
+    the current one, so all windows cost one pass over max(w) lags.
+    """
+    n = len(x)
+    ws = sorted(set(windows))
+    out = {w: np.full(n, np.nan) for w in ws}
+    nan_c = np.concatenate([[0], np.cumsum(np.isnan(x))])
+    cnt = np.zeros(n, dtype=np.int64)
+    for k in range(1, min(ws[-1], n - 1) + 1):
+        cnt[k:] += x[:n - k] < x[k:]
+        if k in out:
+            # NaN in x[i-k:i] or at x[i]
+            bad = (nan_c[k + 1:] - nan_c[:n - k]) > 0
+            out[k][k:] = np.where(bad, np.nan, cnt[k:] / k * 100.0)
+    return out
+
+def _range_percentile(x: np.ndarray, window: int) -> np.ndarray:
+    return _range_percentiles(x, [window])[window]
+
+def _blank_warmup(values: np.ndarray, pos: np.ndarray, window: int) -> np.ndarray:
+    # kernels run over all tickers at once; rows whose window would reach into
+    # the previous ticker (pos < window) are blanked
+    values[pos < window] = np.nan
+    return values
 
-def compute_features(df: pd.DataFrame, windows: Windows | None = None) -> pd.DataFrame:
-    """Compute leakage-safe rolling features per spec."""
+def compute_features(df: pd.DataFrame, windows: Windows | None = None, float_dtype=np.float64) -> pd.DataFrame:
+    """Compute leakage-safe rolling features per spec.
+
+    Kernels always run in float64; `float_dtype=np.float32` only changes how the
+    derived columns are stored (lean mode).
+    """
     if windows is None:
         windows = Windows()
 
-    df = df.copy().sort_values(["ticker","date"]).reset_index(drop=True)
+    df = df.sort_values(["ticker","date"]).reset_index(drop=True)
     df = add_returns(df)
+    ret = df["ret"].to_numpy(dtype=float)
+    df["ret"] = ret.astype(float_dtype, copy=False)
+
+    # position of each row within its ticker
+    pos = df.groupby("ticker", observed=True).cumcount().to_numpy()
 
     # ret_z
-    df["ret_z"], df["ret_mu"], df["ret_sd"] = (np.nan, np.nan, np.nan)
-    df["ret_z"] = df.groupby("ticker", group_keys=False)["ret"].apply(
-        lambda s: _rolling_zscore(s, windows.w_return)[0]
-    )
+    with stage("compute_features.ret_z", len(df)):
+        df["ret_z"] = _blank_warmup(_window_zscore(ret, windows.w_return), pos, windows.w_return).astype(float_dtype, copy=False)
+        df["ret_mu"] = np.full(len(df), np.nan, dtype=float_dtype)
+        df["ret_sd"] = np.full(len(df), np.nan, dtype=float_dtype)
+        del ret
 
     # volz (log volume)
-    df["log_volume"] = np.log(df["volume"].replace(0, np.nan))
-    df["volz"] = df.groupby("ticker", group_keys=False)["log_volume"].apply(
-        lambda s: _rolling_zscore(s, windows.w_volume)[0]
-    )
+    with stage("compute_features.volz", len(df)):
+        log_volume = np.log(df["volume"].replace(0, np.nan).to_numpy(dtype=float))
+        df["log_volume"] = log_volume.astype(float_dtype, copy=False)
+        df["volz"] = _blank_warmup(_window_zscore(log_volume, windows.w_volume), pos, windows.w_volume).astype(float_dtype, copy=False)
+        del log_volume
 
     # intraday range and percentile vs past window
-    df["range"] = (df["high"] - df["low"]) / df["close"].replace(0, np.nan)
-    df["range_pct"] = df.groupby("ticker", group_keys=False)["range"].apply(
-        lambda s: _range_percentile_per_ticker(s, windows.w_range)
-    )
+    with stage("compute_features.range_pct", len(df)):
+        rng = ((df["high"] - df["low"]) / df["close"].replace(0, np.nan)).to_numpy(dtype=float)
+        df["range"] = rng.astype(float_dtype, copy=False)
+        df["range_pct"] = _blank_warmup(_range_percentile(rng, windows.w_range), pos, windows.w_range).astype(float_dtype, copy=False)
+        del rng
 
     # warm-up filter marker
     min_obs = max(windows.w_return, windows.w_volume, windows.w_range)
-    df["has_history"] = df.groupby("ticker").cumcount() >= min_obs
+    df["has_history"] = pos >= min_obs
+    return df
+
+def compute_feature_bank(df: pd.DataFrame, bank: FeatureBank | None = None) -> pd.DataFrame:
+    """Compute every window of `bank` per feature.
+
+    Emits ret_z_w{w}, volz_w{w} and range_pct_w{w}. Z-scores come from shared
+    prefix sums, O(rows) per window whatever its length, and match
+    compute_features' ret_z / volz to ~1e-12 relative (not bit for bit);
+    range percentiles use one lag sweep per feature (exact). has_history marks
+    rows with enough history for the largest window.
+    """
+    if bank is None:
+        bank = FeatureBank()
+
+    df = df.sort_values(["ticker","date"]).reset_index(drop=True)
+    df = add_returns(df)
+    pos = df.groupby("ticker", observed=True).cumcount().to_numpy()
+    starts = np.flatnonzero(pos == 0)
+    df["log_volume"] = np.log(df["volume"].replace(0, np.nan))
+    df["range"] = (df["high"] - df["low"]) / df["close"].replace(0, np.nan)
+
+    zscores = lambda x, ws: _window_zscores_cumsum(x, ws, starts)
+    cols = {}
+    for name, src, ws, kernel in (
+        ("ret_z", "ret", bank.w_return, zscores),
+        ("volz", "log_volume", bank.w_volume, zscores),
+        ("range_pct", "range", bank.w_range, _range_percentiles),
+    ):
+        if not ws:
+            continue
+        for w, v in kernel(df[src].to_numpy(dtype=float), list(ws)).items():
+            cols[f"{name}_w{w}"] = _blank_warmup(v, pos, w)
+    df = pd.concat([df, pd.DataFrame(cols, index=df.index)], axis=1)
+
+    min_obs = max([*bank.w_return, *bank.w_volume, *bank.w_range], default=0)
+    df["has_history"] = pos >= min_obs
     return df
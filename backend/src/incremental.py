@@ -0,0 +1,290 @@
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from .config import Windows
+from .features import FEATURE_COLUMNS, compute_features, _window_zscore, _range_percentile
+from .io_utils import append_pickle, read_pickles
+
+STATE_FILE = "feature_state.npz"
+FEATURES_FILE = "features_log.pkl"
+
+@dataclass
+class FeatureState:
+    """Per-ticker rolling state needed to extend compute_features by new bars.
+
+    Buffers hold the last `w` values of ret / log_volume / range (NaN-padded when
+    a ticker has fewer rows), which is all the past-only windows ever look at.
+    """
+    windows: Windows
+    tickers: np.ndarray         # (T,) str
+    last_date: np.ndarray       # (T,) datetime64[ns]
+    n_obs: np.ndarray           # (T,) rows seen so far (drives has_history)
+    last_adj_close: np.ndarray  # (T,)
+    ret_buf: np.ndarray         # (T, w_return)
+    vol_buf: np.ndarray         # (T, w_volume)
+    rng_buf: np.ndarray         # (T, w_range)
+    log_bytes: int = 0          # size of the features log this state was saved with
+    log_rows: int = 0           # rows in that log, live or superseded
+
+    @classmethod
+    def from_features(cls, feat: pd.DataFrame, windows: Windows | None = None) -> "FeatureState":
+        """Build state from a full compute_features() output."""
+        if windows is None:
+            windows = Windows()
+        feat = feat.sort_values(["ticker", "date"])
+        tickers, first = np.unique(feat["ticker"].to_numpy(dtype=str), return_index=True)
+        bounds = np.append(first, len(feat))
+
+        def tail(col: str, w: int) -> np.ndarray:
+            x = feat[col].to_numpy(dtype=float)
+            buf = np.full((len(tickers), w), np.nan)
+            for i in range(len(tickers)):
+                seg = x[max(bounds[i], bounds[i + 1] - w):bounds[i + 1]]
+                if len(seg):
+                    buf[i, w - len(seg):] = seg
+            return buf
+
+        last = bounds[1:] - 1
+        return cls(
+            windows=windows,
+            tickers=tickers,
+            last_date=feat["date"].to_numpy(dtype="datetime64[ns]")[last],
+            n_obs=np.diff(bounds).astype(np.int64),
+            last_adj_close=feat["adj_close"].to_numpy(dtype=float)[last],
+            ret_buf=tail("ret", windows.w_return),
+            vol_buf=tail("log_volume", windows.w_volume),
+            rng_buf=tail("range", windows.w_range),
+        )
+
+    def save(self, path: str) -> None:
+        w = self.windows
+        np.savez(
+            path,
+            windows=np.array([w.w_return, w.w_volume, w.w_range]),
+            tickers=self.tickers, last_date=self.last_date, n_obs=self.n_obs,
+            last_adj_close=self.last_adj_close,
+            ret_buf=self.ret_buf, vol_buf=self.vol_buf, rng_buf=self.rng_buf,
+            log_bytes=np.int64(self.log_bytes), log_rows=np.int64(self.log_rows),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureState":
+        with np.load(path) as z:
+            d = {k: z[k] for k in z.files}
+        windows = Windows(*(int(v) for v in d.pop("windows")))
+        d["log_bytes"] = int(d.get("log_bytes", 0))
+        d["log_rows"] = int(d.get("log_rows", 0))
+        return cls(windows=windows, **d)
+
+    def merge(self, other: "FeatureState") -> "FeatureState":
+        """This state with `other`'s tickers replaced (or added) by `other`'s rows."""
+        keep = ~np.isin(self.tickers, other.tickers)
+        cat = lambda a, b: np.concatenate([a[keep], b])
+        return FeatureState(
+            windows=self.windows, tickers=cat(self.tickers, other.tickers),
+            last_date=cat(self.last_date, other.last_date.astype("datetime64[ns]")),
+            n_obs=cat(self.n_obs, other.n_obs), last_adj_close=cat(self.last_adj_close, other.last_adj_close),
+            ret_buf=cat(self.ret_buf, other.ret_buf), vol_buf=cat(self.vol_buf, other.vol_buf),
+            rng_buf=cat(self.rng_buf, other.rng_buf), log_bytes=self.log_bytes, log_rows=self.log_rows,
+        )
+
+def stale_tickers(raw: pd.DataFrame, state: FeatureState) -> np.ndarray:
+    """Tickers of `raw` whose history up to the state's last date is no longer
+    the one the state was built from: a different row count, or a different
+    Adj Close on the last date (Yahoo/Kaggle files re-base Adj Close back in
+    time on every dividend or split, which would make the next return wrong)."""
+    tickers = raw["ticker"].astype(str).to_numpy()
+    idx = pd.Index(state.tickers).get_indexer(tickers)
+    known = idx >= 0
+    idx, dates = idx[known], raw["date"].to_numpy(dtype="datetime64[ns]")[known]
+    adj = raw["adj_close"].to_numpy(dtype=float)[known]
+    last = state.last_date[idx]
+    n_old = np.bincount(idx[dates <= last], minlength=len(state.tickers))
+    at_last = dates == last
+    seen = np.zeros(len(state.tickers), dtype=bool)
+    seen[idx[at_last]] = True
+    same_adj = np.ones(len(state.tickers), dtype=bool)
+    a, b = adj[at_last], state.last_adj_close[idx[at_last]]
+    same_adj[idx[at_last]] = (a == b) | (np.isnan(a) & np.isnan(b))
+    bad = (n_old != state.n_obs) | ~seen | ~same_adj
+    present = np.zeros(len(state.tickers), dtype=bool)
+    present[idx] = True
+    return state.tickers[bad & present]
+
+def compute_features_incremental(
+    df_new: pd.DataFrame, state: FeatureState
+) -> tuple[pd.DataFrame, FeatureState]:
+    """Compute features for bars newer than `state`, and the advanced state.
+
+    Rows dated on or before a ticker's last seen date are ignored; tickers not in
+    the state start from scratch. Cost is O(new rows * window), independent of
+    how much history is behind the state, and the result equals the matching
+    rows of compute_features() on the full history.
+    """
+    w = state.windows
+    pos = {t: i for i, t in enumerate(state.tickers)}
+    tickers = list(state.tickers)
+    last_date = list(state.last_date)
+    n_obs = list(state.n_obs)
+    last_adj = list(state.last_adj_close)
+    bufs = {
+        "ret": (w.w_return, list(state.ret_buf)),
+        "log_volume": (w.w_volume, list(state.vol_buf)),
+        "range": (w.w_range, list(state.rng_buf)),
+    }
+
+    frames = []
+    df_new = df_new.sort_values(["ticker", "date"])
+    for t, g in df_new.groupby("ticker", sort=False):
+        i = pos.get(t)
+        if i is None:
+            i = pos[t] = len(tickers)
+            tickers.append(t)
+            last_date.append(np.datetime64("NaT", "ns"))
+            n_obs.append(0)
+            last_adj.append(np.nan)
+            for win, lst in bufs.values():
+                lst.append(np.full(win, np.nan))
+        else:
+            g = g[g["date"].to_numpy(dtype="datetime64[ns]") > last_date[i]]
+        if g.empty:
+            continue
+
+        adj = g["adj_close"].to_numpy(dtype=float)
+        vol = g["volume"].to_numpy(dtype=float)
+        close = g["close"].to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            g["ret"] = adj / np.concatenate([[last_adj[i]], adj[:-1]]) - 1
+            g["log_volume"] = np.log(np.where(vol == 0, np.nan, vol))
+            g["range"] = (g["high"].to_numpy(dtype=float) - g["low"].to_numpy(dtype=float)) / np.where(close == 0, np.nan, close)
+
+        n = len(g)
+        ext = {}
+        for col, (win, lst) in bufs.items():
+            ext[col] = np.concatenate([lst[i], g[col].to_numpy(dtype=float)])
+            lst[i] = ext[col][-win:]
+        g["ret_z"] = _window_zscore(ext["ret"], w.w_return)[-n:]
+        g["ret_mu"], g["ret_sd"] = np.nan, np.nan
+        g["volz"] = _window_zscore(ext["log_volume"], w.w_volume)[-n:]
+        g["range_pct"] = _range_percentile(ext["range"], w.w_range)[-n:]
+        min_obs = max(w.w_return, w.w_volume, w.w_range)
+        g["has_history"] = (n_obs[i] + np.arange(n)) >= min_obs
+
+        last_date[i] = g["date"].to_numpy(dtype="datetime64[ns]")[-1]
+        n_obs[i] += n
+        last_adj[i] = adj[-1]
+        frames.append(g[FEATURE_COLUMNS])
+
+    if frames:
+        feat_new = pd.concat(frames, ignore_index=True)
+    else:
+        feat_new = pd.DataFrame(columns=FEATURE_COLUMNS)
+    new_state = FeatureState(
+        windows=w,
+        tickers=np.array(tickers, dtype=str),
+        last_date=np.array(last_date, dtype="datetime64[ns]"),
+        n_obs=np.array(n_obs, dtype=np.int64),
+        last_adj_close=np.array(last_adj, dtype=float),
+        ret_buf=np.array(bufs["ret"][1]).reshape(len(tickers), w.w_return),
+        vol_buf=np.array(bufs["log_volume"][1]).reshape(len(tickers), w.w_volume),
+        rng_buf=np.array(bufs["range"][1]).reshape(len(tickers), w.w_range),
+        log_bytes=state.log_bytes,
+        log_rows=state.log_rows,
+    )
+    return feat_new, new_state
+
+def _read_log(path: str) -> pd.DataFrame:
+    """Live rows of the features log, sorted by (ticker, date).
+
+    Each segment is (rows, replaced): rows sorted by (ticker, date) and the
+    tickers whose full history it carries, which supersedes their rows in
+    earlier segments. Within a ticker, live segments only ever add later
+    dates, so a stable sort on ticker restores the order; it runs over
+    already-sorted segments, which timsort merges in O(n log segments).
+    """
+    segments = read_pickles(path)
+    owner = {t: k for k, (_, replaced) in enumerate(segments) for t in replaced}
+    live = []
+    for k, (rows, _) in enumerate(segments):
+        gone = [t for t, o in owner.items() if o > k]
+        live.append(rows[~rows["ticker"].isin(gone)] if gone else rows)
+    if len(live) == 1:
+        return live[0]
+    feat = pd.concat(live, ignore_index=True)
+    return feat.sort_values("ticker", kind="stable").reset_index(drop=True)
+
+def _write_log(path: str, feat: pd.DataFrame) -> int:
+    """Replace the log by one segment holding `feat`; returns its size."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    size = append_pickle(tmp, (feat, []))
+    os.replace(tmp, path)
+    return size
+
+def _save_state(state: FeatureState, path: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        state.save(f)
+    os.replace(tmp, path)
+
+def read_features(state_dir: str, tickers=None) -> pd.DataFrame:
+    """Full feature history kept by update_features() in `state_dir`, sorted by
+    (ticker, date); only `tickers` when given. Reads the whole log."""
+    feat = _read_log(os.path.join(state_dir, FEATURES_FILE))
+    if tickers is not None:
+        feat = feat[feat["ticker"].isin(tickers)].reset_index(drop=True)
+    return feat
+
+def update_features(raw: pd.DataFrame, state_dir: str, windows: Windows | None = None) -> pd.DataFrame:
+    """Advance the feature state persisted in `state_dir` by the bars of `raw`
+    and return the rows computed by this run: bars newer than the state, plus
+    the full history of tickers that had to be recomputed. read_features()
+    gives the whole history.
+
+    The history is kept as an append-only log: a run appends only its new rows
+    (sorted by ticker, date), so its cost depends on the new bars, not on the
+    history. Tickers whose source history changed under the state (see
+    stale_tickers) are recomputed in full and their new history supersedes the
+    old one. Falls back to a full compute_features() when there is no state
+    yet, it was built with different windows, or it doesn't match the log (e.g.
+    an interrupted run); the log is compacted to one segment when superseded
+    rows outnumber live ones. Tickers persisted from earlier runs but not in
+    `raw` are kept, not returned.
+    """
+    if windows is None:
+        windows = Windows()
+    state_path = os.path.join(state_dir, STATE_FILE)
+    feat_path = os.path.join(state_dir, FEATURES_FILE)
+    os.makedirs(state_dir, exist_ok=True)
+
+    state = FeatureState.load(state_path) if os.path.exists(state_path) and os.path.exists(feat_path) else None
+    if state is not None and state.windows == windows and state.log_bytes == os.path.getsize(feat_path):
+        stale = stale_tickers(raw, state)
+        redo = raw["ticker"].isin(stale)
+        # drop bars the state already covers before the per-ticker pass sorts and groups them
+        idx = pd.Index(state.tickers).get_indexer(raw["ticker"].astype(str))
+        last = np.where(idx >= 0, state.last_date[idx], np.datetime64("NaT", "ns"))
+        new = (idx < 0) | (raw["date"].to_numpy(dtype="datetime64[ns]") > last)
+        feat, state = compute_features_incremental(raw[new & ~redo.to_numpy()], state)
+        if len(stale):
+            full = compute_features(raw[redo], windows=windows)
+            state = state.merge(FeatureState.from_features(full, windows))
+            feat = pd.concat([f for f in (feat, full) if len(f)], ignore_index=True)
+        if len(feat):
+            feat = feat.sort_values(["ticker", "date"]).reset_index(drop=True)
+            state.log_bytes = append_pickle(feat_path, (feat, list(stale)))
+            state.log_rows += len(feat)
+        # every state row count is a live log row
+        if state.log_rows > 2 * int(state.n_obs.sum()):
+            live = _read_log(feat_path)
+            state.log_bytes, state.log_rows = _write_log(feat_path, live), len(live)
+    else:
+        feat = compute_features(raw, windows=windows)
+        state = FeatureState.from_features(feat, windows)
+        state.log_bytes, state.log_rows = _write_log(feat_path, feat), len(feat)
+
+    _save_state(state, state_path)
+    return feat[feat["ticker"].isin(raw["ticker"].unique())].reset_index(drop=True)
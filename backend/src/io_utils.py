@@ -1,44 +1,238 @@
 from __future__ import annotations
+import io
 import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 
 REQUIRED_COLS = ["Date", "Open", "High", "Low", "Close", "Adj Close", "Volume"]
+# every numeric column is parsed as float64; volume is narrowed back to int64
+# after assembly when it holds whole numbers only (what inference used to give)
+CSV_DTYPES = {c: "float64" for c in REQUIRED_COLS if c != "Date"} | {"Date": "str"}
+SUBDIRS = ["stocks", "etfs", ""]  # lookup order; "" is the flat layout
+OUT_COLS = ["date","ticker","open","high","low","close","adj_close","volume"]
+BATCH_FILES = 128  # files parsed per read_csv call
+CACHE_FILE = "universe_cache.npz"
 
-def _read_one_csv(path: str, ticker: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+def _parse_csv(buf, path: str, ticker: str) -> pd.DataFrame:
+    df = pd.read_csv(buf, usecols=lambda c: c in CSV_DTYPES, dtype=CSV_DTYPES, engine="c")
     missing = [c for c in REQUIRED_COLS if c not in df.columns]
     if missing:
         raise ValueError(f"{ticker}: missing columns {missing} in {path}")
-    df = df.copy()
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df = df.dropna(subset=["Date"]).sort_values("Date")
-    df["ticker"] = ticker
-    # normalize column names to snake_case
-    df = df.rename(columns={
-        "Adj Close": "adj_close",
-        "Open": "open",
-        "High": "high",
-        "Low": "low",
-        "Close": "close",
-        "Volume": "volume",
-        "Date": "date",
+    return df
+
+def _normalize(df: pd.DataFrame, tickers: np.ndarray) -> pd.DataFrame:
+    """Parsed CSV rows (one or many files, file order kept) -> loader schema."""
+    date = pd.to_datetime(df["Date"], errors="coerce", format="ISO8601")
+    bad = date.isna().to_numpy() & df["Date"].notna().to_numpy()
+    for t in np.unique(tickers[bad]):
+        # not ISO: let pandas infer this file's format, as a per-file parse would
+        m = tickers == t
+        date[m] = pd.to_datetime(df["Date"][m], errors="coerce").to_numpy()
+    keep = date.notna().to_numpy()
+    out = pd.DataFrame({
+        "date": date.to_numpy()[keep],
+        "ticker": tickers[keep],
+        "open": df["Open"].to_numpy()[keep],
+        "high": df["High"].to_numpy()[keep],
+        "low": df["Low"].to_numpy()[keep],
+        "close": df["Close"].to_numpy()[keep],
+        "adj_close": df["Adj Close"].to_numpy()[keep],
+        "volume": df["Volume"].to_numpy()[keep],
     })
-    return df[["date","ticker","open","high","low","close","adj_close","volume"]]
-
-def load_universe(data_dir: str, tickers: list[str]) -> pd.DataFrame:
-    """Load CSVs from Kaggle dataset structure: data_dir/stocks or data_dir/etfs."""
-    frames = []
-    for t in tickers:
-        candidates = [
-            os.path.join(data_dir, "stocks", f"{t}.csv"),
-            os.path.join(data_dir, "etfs", f"{t}.csv"),
-            os.path.join(data_dir, f"{t}.csv"),  # allow flat layout
-        ]
-        path = next((p for p in candidates if os.path.exists(p)), None)
-        if not path:
-            raise FileNotFoundError(
-                f"Could not find CSV for {t}. Looked in: " + ", ".join(candidates)
-            )
-        frames.append(_read_one_csv(path, t))
-    df = pd.concat(frames, ignore_index=True)
-    return df.sort_values(["ticker","date"]).reset_index(drop=True)
+    # files are normally date-ordered; sort (stably, per ticker) only if one isn't
+    t, d = out["ticker"].to_numpy(), out["date"].to_numpy()
+    if ((t[1:] == t[:-1]) & (d[1:] < d[:-1])).any():
+        out = out.sort_values(["ticker","date"], kind="stable").reset_index(drop=True)
+    return out
+
+def _read_one_csv(path: str, ticker: str) -> pd.DataFrame:
+    df = _parse_csv(path, path, ticker)
+    return _normalize(df, np.full(len(df), ticker, dtype=object))
+
+def _read_batch(items: list[tuple[str, str]]) -> pd.DataFrame:
+    """Parse a run of (ticker, path) files, one read_csv per distinct header.
+
+    Rows are attributed to tickers by counting each file's data lines; if the
+    parser disagrees with the count (blank lines, quoted newlines...) that
+    group falls back to one read_csv per file.
+    """
+    groups: dict[bytes, list[tuple[str, str, bytes, int]]] = {}
+    for ticker, path in items:
+        with open(path, "rb") as f:
+            raw = f.read()
+        header, _, body = raw.partition(b"\n")
+        body = body.rstrip(b"\r\n")
+        body = body + b"\n" if body else b""
+        groups.setdefault(header.rstrip(b"\r"), []).append((ticker, path, body, body.count(b"\n")))
+
+    parts = []
+    for header, files in groups.items():
+        ticker0, path0 = files[0][0], files[0][1]
+        df = _parse_csv(io.BytesIO(header + b"\n" + b"".join(f[2] for f in files)), path0, ticker0)
+        counts = [f[3] for f in files]
+        if len(df) == sum(counts):
+            tickers = np.repeat(np.array([f[0] for f in files], dtype=object), counts)
+        else:
+            per_file = [_parse_csv(path, path, ticker) for ticker, path, _, _ in files]
+            df = pd.concat(per_file, ignore_index=True)
+            tickers = np.repeat(np.array([f[0] for f in files], dtype=object), [len(p) for p in per_file])
+        parts.append(_normalize(df, tickers))
+    if len(parts) == 1:
+        return parts[0]
+    out = pd.concat(parts, ignore_index=True)
+    return out.sort_values(["ticker"], kind="stable").reset_index(drop=True)
+
+def index_data_dir(data_dir: str) -> dict[str, str]:
+    """Map ticker -> CSV path with one directory listing per layout folder.
+
+    Same precedence as probing stocks/, then etfs/, then data_dir itself.
+    """
+    index: dict[str, str] = {}
+    for sub in SUBDIRS:
+        folder = os.path.join(data_dir, sub)
+        if not os.path.isdir(folder):
+            continue
+        with os.scandir(folder) as it:
+            for e in it:
+                if e.name.endswith(".csv") and e.is_file():
+                    index.setdefault(e.name[:-4], e.path)
+    return index
+
+def _file_key(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def universe_fingerprint(data_dir: str, tickers: list[str]) -> list:
+    """(ticker, path, size, mtime_ns) of every CSV load_universe(tickers) would
+    read (path None when missing): what its output depends on, without parsing."""
+    index = index_data_dir(data_dir)
+    return [(t, index[t], *_file_key(index[t])) if t in index else (t, None) for t in tickers]
+
+def load_cache(cache_dir: str) -> dict | None:
+    """Read the normalized-universe cache written by load_universe(cache_dir=...).
+
+    Entries (ticker, path, size, mtime_ns, start, end) index contiguous row
+    ranges of the stored columns.
+    """
+    path = os.path.join(cache_dir, CACHE_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+def _save_cache(cache_dir: str, entries: dict[str, tuple]) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    names = sorted(entries)
+    lengths = np.array([entries[t][4] for t in names], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    data = {c: np.concatenate([entries[t][3][c] for t in names]) for c in OUT_COLS if c != "ticker"}
+    tmp = os.path.join(cache_dir, f".{CACHE_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            tickers=np.array(names, dtype=str),
+            paths=np.array([entries[t][0] for t in names], dtype=str),
+            sizes=np.array([entries[t][1] for t in names], dtype=np.int64),
+            mtimes=np.array([entries[t][2] for t in names], dtype=np.int64),
+            starts=ends - lengths, ends=ends, **data,
+        )
+    os.replace(tmp, os.path.join(cache_dir, CACHE_FILE))  # readers never see a partial file
+
+def append_pickle(path: str, obj) -> int:
+    """Append one pickle to a log file; returns the file's new size."""
+    with open(path, "ab") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return f.tell()
+
+def read_pickles(path: str) -> list:
+    """Every object appended to `path` by append_pickle, in order."""
+    out = []
+    with open(path, "rb") as f:
+        while True:
+            try:
+                out.append(pickle.load(f))
+            except EOFError:
+                return out
+
+def load_universe(
+    data_dir: str, tickers: list[str], threads: int | None = None, cache_dir: str | None = None
+) -> pd.DataFrame:
+    """Load CSVs from Kaggle dataset structure: data_dir/stocks or data_dir/etfs.
+
+    Files are located through one directory index and parsed in batches of
+    BATCH_FILES (one read_csv per batch, explicit dtypes) on a thread pool.
+    Batches cover contiguous runs of the sorted universe, so concatenating them
+    already gives (ticker, date) order and no global sort is needed.
+
+    With `cache_dir`, normalized rows are kept in a binary columnar cache keyed
+    by each file's path, size and mtime; only new or changed files are parsed.
+    """
+    index = index_data_dir(data_dir)
+    missing = [t for t in tickers if t not in index]
+    if missing:
+        t = missing[0]
+        candidates = [os.path.join(data_dir, sub, f"{t}.csv") for sub in SUBDIRS]
+        raise FileNotFoundError(
+            f"Could not find CSV for {t}. Looked in: " + ", ".join(candidates)
+        )
+
+    uniq = sorted(set(tickers))
+    keys = {t: (index[t], *_file_key(index[t])) for t in uniq} if cache_dir else {}
+    cache = load_cache(cache_dir) if cache_dir else None
+    cached: dict[str, tuple[int, int]] = {}  # ticker -> row range in cache
+    if cache is not None:
+        for i, t in enumerate(cache["tickers"]):
+            key = (str(cache["paths"][i]), int(cache["sizes"][i]), int(cache["mtimes"][i]))
+            if keys.get(t) == key:
+                cached[t] = (int(cache["starts"][i]), int(cache["ends"][i]))
+
+    items = [(t, index[t]) for t in uniq if t not in cached]
+    batches = [items[i:i + BATCH_FILES] for i in range(0, len(items), BATCH_FILES)]
+    with ThreadPoolExecutor(max_workers=threads or min(32, (os.cpu_count() or 1) + 4)) as ex:
+        frames = list(ex.map(_read_batch, batches))
+
+    # pre-sized assembly: one allocation + copy per column
+    if cached:
+        # stitch cached and freshly parsed row ranges back into ticker order
+        fresh = {c: np.concatenate([f[c].to_numpy() for f in frames]) if frames else None for c in OUT_COLS}
+        ft = fresh["ticker"]
+        src = []
+        for t in uniq:
+            if t in cached:
+                src.append((cache, *cached[t]))
+            else:
+                src.append((fresh, int(np.searchsorted(ft, t, "left")), int(np.searchsorted(ft, t, "right"))))
+        lengths = [b - a for _, a, b in src]
+        cols = {c: np.concatenate([s[c][a:b] for s, a, b in src]) for c in OUT_COLS if c != "ticker"}
+        cols["ticker"] = np.repeat(np.array(uniq, dtype=object), lengths)
+    else:
+        cols = {c: np.concatenate([f[c].to_numpy() for f in frames]) for c in OUT_COLS}
+
+    if cache_dir and items:
+        entries = {}
+        if cache is not None:
+            # keep other universes' entries; they are re-validated on read
+            for i, t in enumerate(cache["tickers"]):
+                a, b = int(cache["starts"][i]), int(cache["ends"][i])
+                entries[str(t)] = (str(cache["paths"][i]), int(cache["sizes"][i]), int(cache["mtimes"][i]),
+                                   {c: cache[c][a:b] for c in OUT_COLS if c != "ticker"}, b - a)
+        tk = cols["ticker"]
+        starts = np.searchsorted(tk, uniq, "left")
+        ends = np.searchsorted(tk, uniq, "right")
+        for t, a, b in zip(uniq, starts, ends):
+            entries[t] = (*keys[t], {c: cols[c][a:b] for c in OUT_COLS if c != "ticker"}, int(b - a))
+        _save_cache(cache_dir, entries)
+
+    vol = cols["volume"]
+    if np.isfinite(vol).all() and np.array_equal(vol, np.floor(vol)):
+        cols["volume"] = vol.astype(np.int64)
+    df = pd.DataFrame(cols, columns=OUT_COLS)
+    if len(uniq) != len(tickers):
+        # duplicated tickers: repeat their rows and interleave them as a
+        # global sort would
+        reps = pd.Series(tickers).value_counts()
+        df = df.loc[df.index.repeat(reps.reindex(df["ticker"]).to_numpy())]
+        df = df.sort_values(["ticker","date"], kind="stable").reset_index(drop=True)
+    return df
@@ -1,25 +1,374 @@
 from __future__ import annotations
+import os
+from collections import Counter, deque
+from dataclasses import InitVar, dataclass, field
+from heapq import heappop, heappush
 import numpy as np
 import pandas as pd
 from .config import Windows, Thresholds
+from .features import panel_prev, panel_returns
+from .panel import PanelStore
 
-def compute_market_table(df_feat: pd.DataFrame, windows: Windows | None = None, thr: Thresholds | None = None) -> pd.DataFrame:
+MARKET_WEIGHTS = ["equal", "volume", "cap"]
+
+def _market_weights(df_feat: pd.DataFrame, name: str) -> pd.Series:
+    """Start-of-day weight per row (the ticker's previous bar), so a weighted
+    market return is that of an index rebalanced at the prior close."""
+    if name == "volume":
+        w = df_feat["adj_close"] * df_feat["volume"]  # dollar volume
+    elif name == "cap":
+        if "market_cap" not in df_feat.columns:
+            raise ValueError("cap weighting needs a market_cap column (not in the price CSVs)")
+        w = df_feat["market_cap"]
+    else:
+        raise ValueError(f"unknown market weighting {name!r} (use {', '.join(MARKET_WEIGHTS)})")
+    return w.groupby(df_feat["ticker"], observed=True).shift(1)
+
+def compute_market_table(
+    df_feat: pd.DataFrame, windows: Windows | None = None, thr: Thresholds | None = None,
+    weights: list[str] | None = None,
+) -> pd.DataFrame:
+    """Per-date market_ret (equal-weighted mean ret), breadth (share of ret > 0)
+    and market_anomaly_flag.
+
+    Every statistic is a cythonized groupby sum/mean over one grouping of the
+    rows that have a return. `weights` adds market_ret_<w> / breadth_<w> for
+    "volume" (prior-day dollar volume) and "cap" (prior-day market_cap
+    column) weighting in the same pass; flags stay on the equal-weighted
+    columns.
+    """
     if windows is None:
         windows = Windows()
     if thr is None:
         thr = Thresholds()
+    return _flag_market_days(_market_stats(df_feat, weights), windows, thr)
+
+def _market_sums(df_feat: pd.DataFrame, weights: list[str] | None = None) -> pd.DataFrame:
+    """Per-date additive totals behind the market columns (row count, sum of
+    ret, count of ret > 0, and weight / weight*ret / weight*up per weighting),
+    so tables over disjoint ticker sets can be added together."""
+    extra = [w for w in (weights or []) if w != "equal"]
 
     # use only rows where returns exist (ret can be NaN on first day of each ticker)
-    tmp = df_feat.dropna(subset=["ret"]).copy()
+    ret = df_feat["ret"]
+    valid = ret.notna().to_numpy()
+    up = (ret > 0).astype(np.float64)
+    cols = {"n": np.ones(len(ret)), "ret": ret, "up": up}
+    for name in extra:
+        w = _market_weights(df_feat, name)
+        w = w.where(w.notna() & ret.notna(), 0.0).astype(np.float64)
+        cols[f"w_{name}"] = w
+        cols[f"wr_{name}"] = w * ret.fillna(0.0)
+        cols[f"wu_{name}"] = w * up
     # aggregate per date
-    g = tmp.groupby("date")
-    market_ret = g["ret"].mean()
-    breadth = g.apply(lambda x: (x["ret"] > 0).mean())
-    out = pd.DataFrame({"date": market_ret.index, "market_ret": market_ret.values, "breadth": breadth.values}).sort_values("date")
+    g = pd.DataFrame(cols)[valid].groupby(df_feat["date"].to_numpy()[valid], sort=True)
+    return g.sum().rename_axis("date")
+
+def _market_ratios(sums: pd.DataFrame) -> pd.DataFrame:
+    out = pd.DataFrame({"market_ret": sums["ret"] / sums["n"], "breadth": sums["up"] / sums["n"]}).reset_index()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for c in sums.columns:
+            if c.startswith("w_"):
+                name = c[2:]
+                total = sums[c].to_numpy()
+                out[f"market_ret_{name}"] = sums[f"wr_{name}"].to_numpy() / total
+                out[f"breadth_{name}"] = sums[f"wu_{name}"].to_numpy() / total
+    return out
+
+def _market_stats(df_feat: pd.DataFrame, weights: list[str] | None = None) -> pd.DataFrame:
+    return _market_ratios(_market_sums(df_feat, weights))
+
+def compute_market_table_panel(
+    panel: PanelStore, windows: Windows | None = None, thr: Thresholds | None = None,
+    weights: list[str] | None = None, block: int = 512,
+) -> pd.DataFrame:
+    """compute_market_table() read from a PanelStore (write_panel() of the same
+    rows): per-date totals are masked reductions over the ticker axis of the
+    return panel, taken over blocks of `block` tickers that are zero-copy
+    column slices of the memory maps, so memory stays O(dates * block).
+
+    adj_close is float64 in the panel, so market_ret and breadth match
+    compute_market_table() up to summation order; volume weights come from
+    float32 volumes. "cap" weighting needs a market_cap column, which the
+    panel doesn't have.
+    """
+    if windows is None:
+        windows = Windows()
+    if thr is None:
+        thr = Thresholds()
+    extra = [w for w in (weights or []) if w != "equal"]
+    for name in extra:
+        if name != "volume":
+            raise ValueError(f"{name!r} market weighting is not available from the panel (use equal, volume)")
+
+    n_dates = len(panel.dates)
+    sums = {c: np.zeros(n_dates) for c in ["n", "ret", "up"] + [f"{k}_{n}" for n in extra for k in ("w", "wr", "wu")]}
+    for lo in range(0, len(panel.tickers), block):
+        cols = slice(lo, lo + block)
+        present = panel.field("present")[:, cols]
+        adj = panel.field("adj_close")[:, cols]
+        ret = panel_returns(adj, present)
+        valid = ~np.isnan(ret)
+        up = ret > 0
+        sums["n"] += valid.sum(axis=1)
+        sums["ret"] += np.where(valid, ret, 0.0).sum(axis=1)
+        sums["up"] += up.sum(axis=1)
+        if "volume" in extra:
+            # prior-day dollar volume, as _market_weights
+            dv = np.asarray(adj, dtype=np.float64) * panel.field("volume")[:, cols]
+            w = panel_prev(dv, present)
+            w = np.where(valid & ~np.isnan(w), w, 0.0)
+            sums["w_volume"] += w.sum(axis=1)
+            sums["wr_volume"] += (w * np.where(valid, ret, 0.0)).sum(axis=1)
+            sums["wu_volume"] += (w * up).sum(axis=1)
+
+    keep = sums["n"] > 0
+    table = pd.DataFrame({c: v[keep] for c, v in sums.items()},
+                         index=pd.Index(panel.dates[keep], name="date"))
+    return _flag_market_days(_market_ratios(table), windows, thr)
+
+class MarketAccumulator:
+    """compute_market_table over ticker batches that are never in memory
+    together: add() each batch's features, then table()."""
+
+    def __init__(self, weights: list[str] | None = None):
+        self.weights = weights
+        self.sums: pd.DataFrame | None = None
+
+    def add(self, df_feat: pd.DataFrame) -> None:
+        s = _market_sums(df_feat, self.weights)
+        self.sums = s if self.sums is None else self.sums.add(s, fill_value=0.0)
 
+    def table(self, windows: Windows | None = None, thr: Thresholds | None = None) -> pd.DataFrame:
+        if windows is None:
+            windows = Windows()
+        if thr is None:
+            thr = Thresholds()
+        sums = self.sums if self.sums is not None else pd.DataFrame(columns=["n", "ret", "up"], dtype=float).rename_axis("date")
+        return _flag_market_days(_market_ratios(sums.sort_index()), windows, thr)
+
+def _rolling_past_quantile(x: np.ndarray, window: int, q: float) -> np.ndarray:
+    """q-quantile (linear) of x[i-window:i] for each i; NaN until a full window
+    exists or when the window holds a NaN (shift(1).rolling(window).quantile)."""
+    out = np.full(len(x), np.nan)
+    if len(x) > window:
+        windows_ = np.lib.stride_tricks.sliding_window_view(x[:-1], window)
+        out[window:] = np.quantile(windows_, q, axis=1)
+    return out
+
+def _flag_market_days(out: pd.DataFrame, windows: Windows, thr: Thresholds) -> pd.DataFrame:
     # rolling threshold for |market_ret| 95th percentile using past window only
     abs_mkt = out["market_ret"].abs()
-    roll_thr = abs_mkt.shift(1).rolling(window=windows.w_return, min_periods=windows.w_return).quantile(thr.market_ret_pct/100.0)
+    roll_thr = _rolling_past_quantile(abs_mkt.to_numpy(dtype=float), windows.w_return, thr.market_ret_pct/100.0)
     out["market_anomaly_flag"] = ((abs_mkt > roll_thr) | (out["breadth"] < thr.market_breadth)).astype(int)
 
     return out
+
+def _lerp(a: float, b: float, t: float) -> float:
+    # np.quantile(method="linear") between neighbouring order statistics, same arithmetic
+    return b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+
+def _prune(heap: list[float], gone: Counter) -> None:
+    while heap and gone[heap[0]]:
+        gone[heap[0]] -= 1
+        heappop(heap)
+
+@dataclass
+class MarketState:
+    """Rolling |market_ret| window behind market_anomaly_flag, so new dates can
+    be flagged without the history.
+
+    The window's values are split at the quantile's rank into a max-heap of
+    the lowest ones and a min-heap of the rest, so the two order statistics
+    the quantile interpolates between are the heap tops. Each new day inserts
+    one value and evicts the oldest (deleted lazily when it reaches a top),
+    both O(log w); NaNs are only counted, since any NaN in the window makes
+    the threshold NaN.
+    """
+    w: int
+    q: float
+    min_breadth: float
+    columns: list[str]          # market table layout the state was built for
+    last_date: np.datetime64
+    values: InitVar[np.ndarray]  # last <= w |market_ret| values, oldest first
+    # sorted tickers the table covers and their row counts up to last_date
+    universe: np.ndarray = field(default_factory=lambda: np.array([], dtype=str))
+    n_rows: np.ndarray = field(default_factory=lambda: np.array([], dtype=np.int64))
+
+    def __post_init__(self, values: np.ndarray) -> None:
+        self._order = deque(float(v) for v in values)
+        self._rank = int(np.floor((self.w - 1) * self.q))  # of the lower neighbour
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        vals = sorted(v for v in self._order if not np.isnan(v))
+        k = min(self._rank + 1, len(vals))
+        self._low = [-v for v in reversed(vals[:k])]  # max-heap as negated, already heap-ordered
+        self._high = vals[k:]                        # sorted, so already a min-heap
+        self._n_low, self._n_high = k, len(vals) - k
+        self._gone_low, self._gone_high = Counter(), Counter()
+        self._nans = len(self._order) - len(vals)
+
+    @classmethod
+    def from_table(cls, table: pd.DataFrame, windows: Windows | None = None, thr: Thresholds | None = None) -> "MarketState":
+        """State after the last row of a compute_market_table() output."""
+        if windows is None:
+            windows = Windows()
+        if thr is None:
+            thr = Thresholds()
+        tail = table["market_ret"].abs().to_numpy(dtype=float)[-windows.w_return:]
+        last = table["date"].to_numpy(dtype="datetime64[ns]")[-1] if len(table) else np.datetime64("NaT", "ns")
+        return cls(windows.w_return, thr.market_ret_pct / 100.0, thr.market_breadth, list(table.columns), last, tail)
+
+    def matches(self, windows: Windows, thr: Thresholds, columns: list[str]) -> bool:
+        return (self.w, self.q, self.min_breadth, self.columns) == (
+            windows.w_return, thr.market_ret_pct / 100.0, thr.market_breadth, columns)
+
+    @property
+    def window(self) -> np.ndarray:
+        return np.array(self._order, dtype=float)
+
+    def _balance(self) -> None:
+        # keep the lowest min(rank + 1, n) values in the low heap
+        target = min(self._rank + 1, self._n_low + self._n_high)
+        while self._n_low > target:
+            _prune(self._low, self._gone_low)
+            heappush(self._high, -heappop(self._low))
+            self._n_low, self._n_high = self._n_low - 1, self._n_high + 1
+        while self._n_low < target:
+            _prune(self._high, self._gone_high)
+            heappush(self._low, -heappop(self._high))
+            self._n_low, self._n_high = self._n_low + 1, self._n_high - 1
+
+    def _in_low(self, x: float) -> bool:
+        # every low value <= every high value, so x belongs low iff it is <= the low top
+        _prune(self._low, self._gone_low)
+        return self._n_low > 0 and x <= -self._low[0]
+
+    def push(self, x: float) -> None:
+        if len(self._order) == self.w:
+            old = self._order.popleft()
+            if np.isnan(old):
+                self._nans -= 1
+            elif self._in_low(old):
+                self._gone_low[-old] += 1
+                self._n_low -= 1
+            else:
+                self._gone_high[old] += 1
+                self._n_high -= 1
+        self._order.append(x)
+        if np.isnan(x):
+            self._nans += 1
+        elif self._in_low(x):
+            heappush(self._low, -x)
+            self._n_low += 1
+        else:
+            heappush(self._high, x)
+            self._n_high += 1
+        self._balance()
+        if len(self._low) + len(self._high) > 2 * self.w:
+            self._rebuild()  # drop lazily deleted entries; O(w log w) every >= w pushes
+
+    def threshold(self) -> float:
+        """Quantile of the current window; NaN until it is full or while it holds a NaN."""
+        if len(self._order) < self.w or self._nans:
+            return np.nan
+        _prune(self._low, self._gone_low)
+        _prune(self._high, self._gone_high)
+        a = -self._low[0]
+        b = self._high[0] if self._n_high else a
+        return _lerp(a, b, (self.w - 1) * self.q - self._rank)
+
+    def save(self, path: str) -> None:
+        np.savez(path, params=np.array([self.w, self.q, self.min_breadth]), columns=np.array(self.columns),
+                 last_date=self.last_date, window=self.window,
+                 universe=self.universe.astype(str), n_rows=self.n_rows)
+
+    @classmethod
+    def load(cls, path: str) -> "MarketState":
+        with np.load(path) as z:
+            w, q, min_breadth = z["params"]
+            return cls(int(w), float(q), float(min_breadth), z["columns"].tolist(),
+                       z["last_date"][()], z["window"],
+                       *((z["universe"], z["n_rows"]) if "universe" in z.files else ()))
+
+def append_market_days(stats: pd.DataFrame, state: MarketState) -> pd.DataFrame:
+    """Flag the per-date stats dated after `state`, advancing it. Rows equal the
+    matching ones of compute_market_table() on the full history."""
+    if not np.isnat(state.last_date):
+        stats = stats[stats["date"].to_numpy(dtype="datetime64[ns]") > state.last_date]
+    new = stats.reset_index(drop=True)
+    abs_mkt = new["market_ret"].abs().to_numpy(dtype=float)
+    roll_thr = np.empty(len(new))
+    for i, x in enumerate(abs_mkt):
+        roll_thr[i] = state.threshold()
+        state.push(x)
+    if len(new):
+        state.last_date = new["date"].to_numpy(dtype="datetime64[ns]")[-1]
+    new["market_anomaly_flag"] = ((abs_mkt > roll_thr) | (new["breadth"] < state.min_breadth)).astype(int)
+    return new
+
+MARKET_STATE_FILE = "market_state.npz"
+MARKET_TABLE_FILE = "market_table.pkl"
+
+def _market_columns(weights: list[str] | None) -> list[str]:
+    extra = [w for w in (weights or []) if w != "equal"]
+    return ["date", "market_ret", "breadth"] + [f"{c}_{w}" for w in extra for c in ("market_ret", "breadth")] \
+        + ["market_anomaly_flag"]
+
+def _row_counts(tickers: np.ndarray, dates: np.ndarray, last_date: np.datetime64) -> tuple[np.ndarray, np.ndarray]:
+    """Sorted tickers and each one's row count dated on or before last_date."""
+    universe, inv = np.unique(tickers, return_inverse=True)
+    old = dates <= last_date if not np.isnat(last_date) else np.zeros(len(dates), dtype=bool)
+    return universe, np.bincount(inv[old], minlength=len(universe)).astype(np.int64)
+
+def update_market_table(
+    df_feat: pd.DataFrame, state_dir: str, windows: Windows | None = None, thr: Thresholds | None = None,
+    weights: list[str] | None = None, verify: bool = False,
+) -> pd.DataFrame:
+    """compute_market_table() for `df_feat`, reusing the table and rolling
+    window persisted in `state_dir`: only dates after the saved state are
+    aggregated and flagged. Falls back to a full build when there is no state
+    yet, it was built with other windows/thresholds/weights, or the tickers or
+    their row counts up to the saved date changed (old dates would keep the
+    old universe/history). `verify` also
+    runs the full build and raises if the two differ.
+    """
+    if windows is None:
+        windows = Windows()
+    if thr is None:
+        thr = Thresholds()
+    state_path = os.path.join(state_dir, MARKET_STATE_FILE)
+    table_path = os.path.join(state_dir, MARKET_TABLE_FILE)
+
+    tickers = df_feat["ticker"].astype(str).to_numpy()
+    dates = df_feat["date"].to_numpy(dtype="datetime64[ns]")
+    state = MarketState.load(state_path) if os.path.exists(state_path) and os.path.exists(table_path) else None
+    if (state is not None and state.matches(windows, thr, _market_columns(weights))
+            and all(np.array_equal(a, b) for a, b in zip(_row_counts(tickers, dates, state.last_date),
+                                                          (state.universe, state.n_rows)))):
+        table = pd.read_pickle(table_path)
+        new = dates > state.last_date
+        if weights and any(w != "equal" for w in weights):
+            # weights are the prior bar's, so keep each ticker's last old row
+            # (rows are date-sorted within a ticker, as compute_features leaves them)
+            new |= ~df_feat["ticker"].where(~new).duplicated(keep="last").to_numpy() & ~new
+        rows = append_market_days(_market_stats(df_feat[new], weights), state)
+        if len(rows):
+            table = pd.concat([table, rows[table.columns]], ignore_index=True)
+    else:
+        table = compute_market_table(df_feat, windows, thr, weights)
+        state = MarketState.from_table(table, windows, thr)
+    state.universe, state.n_rows = _row_counts(tickers, dates, state.last_date)
+
+    if verify:
+        full = compute_market_table(df_feat, windows, thr, weights)
+        try:
+            pd.testing.assert_frame_equal(table, full)
+        except AssertionError as e:
+            raise RuntimeError(f"incremental market table differs from a full rebuild: {e}") from None
+
+    os.makedirs(state_dir, exist_ok=True)
+    state.save(state_path)
+    table.to_pickle(table_path)
+    return table
@@ -1,22 +1,62 @@
 from __future__ import annotations
 import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-from .reporting import monthly_mini_report
+from .reporting import monthly_reports
+from .store import read_output
+
+def parse_months(spec: str) -> list[str] | None:
+    """"2020-02", "2020-01,2020-03", "2020-01:2020-06" (inclusive) or "all" (None)."""
+    if spec == "all":
+        return None
+    months = []
+    for part in spec.split(","):
+        if ":" in part:
+            lo, hi = part.split(":")
+            months += [str(p) for p in pd.period_range(lo.strip(), hi.strip(), freq="M")]
+        elif part.strip():
+            months.append(str(pd.Period(part.strip(), "M")))
+    if not months:
+        raise ValueError("no months given")
+    return sorted(set(months))
+
+def _write(rep: pd.DataFrame, path: str) -> str:
+    rep.to_csv(path, index=False)
+    return path
+
+def write_monthly_reports(out_dir: str, months: list[str] | None, workers: int = 1) -> list[str]:
+    """Read both tables once (only the span of `months`; everything for None),
+    build every report in one pass and write monthly_report_YYYY-MM.csv per
+    month, in `workers` processes when > 1. For None, every month of the market
+    table gets a report."""
+    start = None if months is None else f"{months[0]}-01"
+    end = None if months is None else str(pd.Period(months[-1], "M").end_time.date())
+    mt = read_output(out_dir, "market_day_table", start, end)
+    dc = read_output(out_dir, "daily_anomaly_card", start, end)
+    if months is None:
+        months = sorted(mt["date"].astype(str).str[:7].unique())
+
+    reps = monthly_reports(dc, mt, months)
+    paths = [os.path.join(out_dir, f"monthly_report_{mo}.csv") for mo in months]
+    if workers <= 1 or len(months) <= 1:
+        return [_write(reps[mo], path) for mo, path in zip(months, paths)]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(_write, [reps[mo] for mo in months], paths))
 
 def main():
-    p = argparse.ArgumentParser(description="Monthly mini-report for YYYY-MM.")
+    p = argparse.ArgumentParser(description="Monthly mini-reports for one or more months.")
     p.add_argument("--out-dir", default="outputs", help="Folder containing market_day_table.csv and daily_anomaly_card.csv")
-    p.add_argument("--month", required=True, help="YYYY-MM")
+    p.add_argument("--month", required=True, help="YYYY-MM, a list '2020-01,2020-03', a range '2020-01:2020-06', or 'all'.")
+    p.add_argument("--workers", type=int, default=1, help="Processes writing the report CSVs.")
     args = p.parse_args()
+    try:
+        months = parse_months(args.month)
+    except ValueError as e:
+        p.error(f"bad --month {args.month!r}: {e}")
 
-    mt = pd.read_csv(os.path.join(args.out_dir, "market_day_table.csv"))
-    dc = pd.read_csv(os.path.join(args.out_dir, "daily_anomaly_card.csv"))
-
-    rep = monthly_mini_report(dc, mt, args.month)
-    out_path = os.path.join(args.out_dir, f"monthly_report_{args.month}.csv")
-    rep.to_csv(out_path, index=False)
-    print(f"Wrote: {out_path}")
+    for path in write_monthly_reports(args.out_dir, months, args.workers):
+        print(f"Wrote: {path}")
 
 if __name__ == "__main__":
     main()
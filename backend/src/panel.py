@@ -0,0 +1,97 @@
+from __future__ import annotations
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from .store import CURRENT_FILE, current_version, new_version, publish_version
+
+PANEL_FIELDS = ["open", "high", "low", "close", "adj_close", "volume"]
+# returns (and so breadth) are taken from adj_close: float32 would round a
+# 4e-8 move to zero and flip its sign test
+PANEL_DTYPES = {f: np.float64 if f == "adj_close" else np.float32 for f in PANEL_FIELDS}
+
+def write_panel(raw: pd.DataFrame, panel_dir: str, keep: int = 2) -> str:
+    """Write a load_universe() frame as dense dates x tickers .npy files.
+
+    Layout of each version under panel_dir/<version>/: dates.npy (D,)
+    datetime64[ns], tickers.npy (T,) str, one (D, T) array per PANEL_FIELDS
+    entry (float32, adj_close float64; NaN where a ticker has no bar) and
+    present.npy (D, T) bool marking the bars that exist in the source. A version is written to a
+    staging folder and published like the output store (rename, then atomic
+    swap of panel_dir/CURRENT), so files a reader has mapped are never
+    rewritten; the `keep` newest versions are kept. Returns the version.
+    """
+    os.makedirs(panel_dir, exist_ok=True)
+    version = new_version()
+    stage = os.path.join(panel_dir, f".staging-{version}")
+    shutil.rmtree(stage, ignore_errors=True)
+    os.makedirs(stage)
+
+    d = raw["date"].to_numpy(dtype="datetime64[ns]")
+    t = raw["ticker"].to_numpy(dtype=str)
+    dates, di = np.unique(d, return_inverse=True)
+    tickers, ti = np.unique(t, return_inverse=True)
+    shape = (len(dates), len(tickers))
+
+    present = np.lib.format.open_memmap(os.path.join(stage, "present.npy"), mode="w+", dtype=bool, shape=shape)
+    present[:] = False
+    present[di, ti] = True
+    present.flush()
+    del present
+    for f in PANEL_FIELDS:
+        a = np.lib.format.open_memmap(os.path.join(stage, f"{f}.npy"), mode="w+", dtype=PANEL_DTYPES[f], shape=shape)
+        a[:] = np.nan
+        a[di, ti] = raw[f].to_numpy(dtype=PANEL_DTYPES[f])
+        a.flush()
+        del a
+    np.save(os.path.join(stage, "tickers.npy"), tickers)
+    np.save(os.path.join(stage, "dates.npy"), dates)
+    return publish_version(panel_dir, stage, version, keep)
+
+class PanelStore:
+    """Read side of write_panel(), pinned to the version that was current when
+    it was opened. Field arrays are memory-mapped read-only up front (cheap:
+    nothing is read until sliced), so slices are views of the page cache
+    shared by every process reading the same panel, and a later publish that
+    deletes the version doesn't pull files from under the reader."""
+
+    def __init__(self, panel_dir: str):
+        self.panel_dir = panel_dir
+        self.version = current_version(panel_dir)
+        root = os.path.join(panel_dir, self.version)
+        self.dates = np.load(os.path.join(root, "dates.npy"))
+        self.tickers = np.load(os.path.join(root, "tickers.npy"))
+        self._ticker_pos = {t: i for i, t in enumerate(self.tickers)}
+        self._arrays = {f: np.load(os.path.join(root, f"{f}.npy"), mmap_mode="r") for f in [*PANEL_FIELDS, "present"]}
+
+    @staticmethod
+    def exists(panel_dir: str) -> bool:
+        return os.path.exists(os.path.join(panel_dir, CURRENT_FILE))
+
+    def field(self, name: str) -> np.ndarray:
+        """(D, T) memory-mapped array for a PANEL_FIELDS entry or "present"."""
+        try:
+            return self._arrays[name]
+        except KeyError:
+            raise KeyError(f"unknown panel field {name!r}") from None
+
+    def date_slice(self, start=None, end=None) -> slice:
+        """Row slice for dates in [start, end] (either bound optional)."""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), "ns"), "left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), "ns"), "right"))
+        return slice(lo, hi)
+
+    def ticker_index(self, ticker: str) -> int:
+        try:
+            return self._ticker_pos[ticker]
+        except KeyError:
+            raise KeyError(f"ticker {ticker!r} not in panel") from None
+
+    def series(self, ticker: str, field: str, start=None, end=None) -> tuple[np.ndarray, np.ndarray]:
+        """(dates, values) of one ticker's field over the panel calendar.
+
+        values is a strided view of the memory map (no copy), NaN on dates the
+        ticker has no bar.
+        """
+        rows = self.date_slice(start, end)
+        return self.dates[rows], self.field(field)[rows, self.ticker_index(ticker)]
@@ -0,0 +1,181 @@
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+from .config import Windows, Thresholds
+from .io_utils import load_universe
+from .features import compute_features
+from .detectors_rule import detect_rule_based
+
+STAGES = ["load_universe", "compute_features", "detect_rule_based"]
+
+def frame_to_shm(df: pd.DataFrame) -> dict:
+    """Copy a frame's columns into one shared-memory block and return its layout.
+
+    Numeric/datetime/bool columns are stored raw; anything else is factorized to
+    int32 codes plus a (small) list of unique values. The caller that reads the
+    block back with frame_from_shm() owns it and unlinks it.
+    """
+    cols = []
+    for c in df.columns:
+        s = df[c]
+        if isinstance(s.dtype, np.dtype) and s.dtype.kind in "biufM":
+            cols.append((c, s.to_numpy(), None, str(s.dtype)))
+        else:
+            codes, uniques = pd.factorize(s)
+            cols.append((c, codes.astype(np.int32), list(uniques), str(s.dtype)))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(sum(a.nbytes for _, a, _, _ in cols), 1))
+    layout, offset = [], 0
+    for c, a, uniques, dtype in cols:
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf, offset=offset)[:] = a
+        layout.append((c, a.dtype.str, offset, uniques, dtype))
+        offset += a.nbytes
+    shm.close()
+    # ownership moves to the reading process; stop this process' tracker from
+    # unlinking the block when the worker exits
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return {"name": shm.name, "nrows": len(df), "columns": layout}
+
+def release_shm(meta: dict) -> None:
+    """Unlink a block written by frame_to_shm() if it still exists."""
+    try:
+        shm = shared_memory.SharedMemory(name=meta["name"])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+def frame_from_shm(meta: dict) -> pd.DataFrame:
+    """Rebuild a frame written by frame_to_shm() and release the block."""
+    shm = shared_memory.SharedMemory(name=meta["name"])
+    try:
+        data = {}
+        for c, astr, offset, uniques, dtype in meta["columns"]:
+            a = np.ndarray(meta["nrows"], dtype=np.dtype(astr), buffer=shm.buf, offset=offset).copy()
+            if uniques is None:
+                data[c] = a
+            else:
+                vals = np.asarray(uniques + [np.nan], dtype=object)[a]  # code -1 -> NaN
+                data[c] = pd.Series(vals).astype(dtype)
+        return pd.DataFrame(data)
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _run_shard(
+    data_dir: str, tickers: list[str], windows: Windows, thr: Thresholds, lean: bool, cache_dir: str | None
+) -> dict:
+    # CPU time of this process as well as wall time: shards that share a core
+    # stretch each other's wall time, not their CPU time, so summed CPU time is
+    # the serial work
+    marks = [(time.perf_counter(), time.process_time())]
+    raw = load_universe(data_dir, tickers, cache_dir=cache_dir)
+    marks.append((time.perf_counter(), time.process_time()))
+    feat = compute_features(raw, windows=windows, float_dtype=np.float32 if lean else np.float64)
+    marks.append((time.perf_counter(), time.process_time()))
+    det = detect_rule_based(feat, thr=thr)
+    marks.append((time.perf_counter(), time.process_time()))
+    wall = {s: b[0] - a[0] for s, a, b in zip(STAGES, marks, marks[1:])}
+    cpu = {s: b[1] - a[1] for s, a, b in zip(STAGES, marks, marks[1:])}
+    rows = dict(zip(STAGES, (len(raw), len(feat), len(det))))
+    # det is feat[has_history] plus the rule columns, so only those columns travel
+    rule_cols = [c for c in det.columns if c not in feat.columns]
+    feat_meta = frame_to_shm(feat)
+    try:
+        rule_meta = frame_to_shm(det[rule_cols])
+    except BaseException:
+        release_shm(feat_meta)
+        raise
+    return {"feat": feat_meta, "rule": rule_meta, "wall": wall, "cpu": cpu, "rows": rows}
+
+def load_features_sharded(
+    data_dir: str,
+    tickers: list[str],
+    workers: int,
+    windows: Windows | None = None,
+    thr: Thresholds | None = None,
+    lean: bool = False,
+    cache_dir: str | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """Run load_universe -> compute_features -> detect_rule_based on ticker shards
+    in a process pool.
+
+    Returns (feat, det, report) where feat/det equal the serial pipeline's outputs
+    (duplicate tickers included) and report holds per-shard wall/CPU times and
+    rows per stage and the pool and gather times (see format_shard_report). `lean`
+    stores float32 features and categorical tickers, as walkforward --lean does.
+    With `cache_dir`, each shard keeps its own load_universe cache in a
+    subfolder (shards are deterministic for a given universe and worker count).
+    """
+    if windows is None:
+        windows = Windows()
+    if thr is None:
+        thr = Thresholds()
+
+    # contiguous shards of the sorted universe keep the concatenation in
+    # (ticker, date) order, the same order compute_features produces; a ticker
+    # listed twice goes to one shard twice, so it is loaded as the serial run does
+    uniq, counts = np.unique(np.asarray(tickers, dtype=str), return_counts=True)
+    reps = dict(zip(uniq, counts))
+    shards = [[t for t in s for _ in range(reps[t])] for s in np.array_split(uniq, min(workers, len(uniq))) if len(s)]
+    n = len(shards)
+    caches = [os.path.join(cache_dir, f"shard{i}of{n}") if cache_dir else None for i in range(n)]
+    results = []
+    try:
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=n) as ex:
+            futures = [ex.submit(_run_shard, data_dir, shard, windows, thr, lean, cache)
+                       for shard, cache in zip(shards, caches)]
+            try:
+                for f in futures:
+                    results.append(f.result())
+            finally:
+                # a failed shard must not leak the blocks the others created
+                for f in futures[len(results):]:
+                    if not f.cancel() and f.exception() is None:
+                        results.append(f.result())
+        t1, c1 = time.perf_counter(), time.process_time()
+
+        feats, rules = [], []
+        for r in results:
+            feats.append(frame_from_shm(r["feat"]))
+            rules.append(frame_from_shm(r["rule"]))
+        feat = pd.concat(feats, ignore_index=True)
+        if lean:
+            feat["ticker"] = feat["ticker"].astype("category")
+        det = feat[feat["has_history"]]
+        rule = pd.concat(rules, ignore_index=True)
+        for c in rule.columns:
+            det[c] = rule[c].to_numpy()
+        t2, c2 = time.perf_counter(), time.process_time()
+    finally:
+        for r in results:
+            release_shm(r["feat"])
+            release_shm(r["rule"])
+
+    report = {
+        "workers": n,
+        **{k: {s: [r[k][s] for r in results] for s in STAGES} for k in ("wall", "cpu", "rows")},
+        "pool_wall": t1 - t0,
+        "gather_wall": t2 - t1,
+        "gather_cpu": c2 - c1,
+    }
+    return feat, det, report
+
+def format_shard_report(report: dict) -> str:
+    """Per-stage CPU time summed over shards (an estimate of the serial work)
+    and the largest shard's share, then the pipeline speedup: summed CPU time
+    over what the sharded run took (pool plus gather wall time). Worker start-up
+    and the transfer are not in the CPU sum, so on one core this is below 1x."""
+    lines = [f"Sharded pipeline ({report['workers']} workers):"]
+    for s, ts in report["cpu"].items():
+        lines.append(f"  {s:<18} cpu {sum(ts):8.2f}s  largest shard {max(ts):8.2f}s")
+    work = sum(sum(ts) for ts in report["cpu"].values())
+    wall = report["pool_wall"] + report["gather_wall"]
+    lines.append(f"  pool wall {report['pool_wall']:.2f}s + gather {report['gather_wall']:.2f}s = {wall:.2f}s; "
+                 f"speedup vs summed shard cpu {work / max(wall, 1e-9):.2f}x")
+    return "\n".join(lines)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+class Profiler:
+    """Wall time, CPU time, peak-RSS growth and row counts per named stage.
+
+    Stages nest (depth is recorded); a stage's numbers include its children.
+    peak_rss_delta_mb is how much the process' high-water mark rose during the
+    stage, so it is 0 for a stage that stayed under an earlier peak. With
+    `hot`, every top-level stage also runs under cProfile and the profile of
+    the slowest one is kept for dump (cProfile slows Python-heavy stages, so
+    compare timings of runs with the same setting).
+    """
+
+    def __init__(self, hot: bool = False):
+        self.hot = hot
+        self.records: list[dict] = []
+        self._t0 = time.perf_counter()
+        self._depth = 0
+        self._hot: tuple[float, str, cProfile.Profile] | None = None
+
+    @contextmanager
+    def stage(self, name: str, rows: int | None = None):
+        rec = {"stage": name, "depth": self._depth, "start": time.perf_counter() - self._t0, "rows": rows}
+        prof = cProfile.Profile() if self.hot and self._depth == 0 else None
+        t0, c0, m0 = time.perf_counter(), time.process_time(), peak_rss_mb()
+        self._depth += 1
+        if prof:
+            prof.enable()
+        try:
+            yield rec
+        finally:
+            if prof:
+                prof.disable()
+            self._depth -= 1
+            m1 = peak_rss_mb()
+            rec["wall"] = time.perf_counter() - t0
+            rec["cpu"] = time.process_time() - c0
+            rec["peak_rss_delta_mb"] = m1 - m0 if m0 is not None else None
+            self.records.append(rec)
+            if prof and (self._hot is None or rec["wall"] > self._hot[0]):
+                self._hot = (rec["wall"], name, prof)
+
+    def record(self, name: str, wall: float, cpu: float, rows: int | None = None, **extra) -> None:
+        """Add a stage timed elsewhere (e.g. in a worker process)."""
+        self.records.append({"stage": name, "depth": self._depth, "start": time.perf_counter() - self._t0 - wall,
+                             "rows": rows, "wall": wall, "cpu": cpu, "peak_rss_delta_mb": None, **extra})
+
+    def report(self, **extra) -> dict:
+        return {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "total_wall": time.perf_counter() - self._t0, "peak_rss_mb": peak_rss_mb(),
+            "hot_stage": self._hot[1] if self._hot else None,
+            "stages": sorted(self.records, key=lambda r: r["start"]),
+            **extra,
+        }
+
+    def write(self, path: str, **extra) -> list[str]:
+        """Write the JSON report to `path`; with `hot`, also <path>.prof (pstats
+        format, e.g. for snakeviz) and <path>.txt with the top functions of the
+        slowest stage. Returns the files written."""
+        with open(path, "w") as f:
+            json.dump(self.report(**extra), f, indent=1, default=str)
+        written = [path]
+        if self._hot:
+            base = os.path.splitext(path)[0]
+            _, name, prof = self._hot
+            prof.dump_stats(base + ".prof")
+            buf = io.StringIO()
+            buf.write(f"cProfile of the slowest stage: {name}\n")
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(30)
+            with open(base + ".txt", "w") as f:
+                f.write(buf.getvalue())
+            written += [base + ".prof", base + ".txt"]
+        return written
+
+_active: Profiler | None = None
+
+def start(hot: bool = False) -> Profiler:
+    """Make a new Profiler the one stage()/timed()/record() report to."""
+    global _active
+    _active = Profiler(hot)
+    return _active
+
+def stop() -> None:
+    global _active
+    _active = None
+
+def stage(name: str, rows: int | None = None):
+    """Context manager timing `name` under the active profiler; a no-op (that
+    still yields a dict) when profiling is off."""
+    return _active.stage(name, rows) if _active else nullcontext({})
+
+def timed(name: str, fn: Callable[[], Any]) -> Any:
+    """fn() as a stage; rows is len() of the result when it is a frame or array."""
+    with stage(name) as rec:
+        out = fn()
+        rec["rows"] = len(out) if hasattr(out, "shape") else None
+    return out
+
+def record(name: str, wall: float, cpu: float, rows: int | None = None, **extra) -> None:
+    if _active:
+        _active.record(name, wall, cpu, rows, **extra)
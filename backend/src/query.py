@@ -1,40 +1,52 @@
 from __future__ import annotations
 import argparse
-import os
-import pandas as pd
+from .store import read_output
+
+CARD_COLUMNS = ["ticker", "type", "ret", "ret_z", "volz", "range_pct", "why"]
 
 def main():
-    p = argparse.ArgumentParser(description="Date query: show market status + anomalous tickers for that day.")
+    p = argparse.ArgumentParser(description="Date query: show market status + anomalous tickers for a day or a date range.")
     p.add_argument("--out-dir", default="outputs", help="Folder containing market_day_table.csv and daily_anomaly_card.csv")
-    p.add_argument("--date", required=True, help="YYYY-MM-DD")
+    p.add_argument("--date", default=None, help="YYYY-MM-DD")
+    p.add_argument("--start", default=None, help="First date of a range (YYYY-MM-DD), instead of --date.")
+    p.add_argument("--end", default=None, help="Last date of a range (YYYY-MM-DD), instead of --date.")
+    p.add_argument("--tickers", default=None, help="Only these tickers, comma-separated.")
     args = p.parse_args()
+    if (args.date is None) == (args.start is None and args.end is None):
+        p.error("give either --date or --start/--end")
 
-    mt_path = os.path.join(args.out_dir, "market_day_table.csv")
-    dc_path = os.path.join(args.out_dir, "daily_anomaly_card.csv")
-
-    mt = pd.read_csv(mt_path)
-    dc = pd.read_csv(dc_path)
+    # the store's date index reads only the rows in range; CSV outputs are parsed in full
+    start, end = (args.date, args.date) if args.date else (args.start, args.end)
+    tickers = [t.strip().upper() for t in args.tickers.split(",") if t.strip()] if args.tickers else None
+    mt = read_output(args.out_dir, "market_day_table", start, end)
+    dc = read_output(args.out_dir, "daily_anomaly_card", start, end, tickers=tickers)
 
-    date = args.date
-    mrow = mt[mt["date"] == date]
-    if mrow.empty:
-        print(f"No market row found for date={date}. Did you run walkforward?")
+    if mt.empty:
+        what = f"date={args.date}" if args.date else f"dates {start or '...'} to {end or '...'}"
+        print(f"No market row found for {what}. Did you run walkforward?")
         return
 
-    m = mrow.iloc[0].to_dict()
-    print("=== Market Status ===")
-    print(f"date: {m['date']}")
-    print(f"market_ret: {m['market_ret']:.6f}")
-    print(f"breadth: {m['breadth']:.3f}")
-    print(f"market_anomaly_flag: {int(m['market_anomaly_flag'])}")
+    rows = dc[dc["anomaly_flag"] == 1]
+    if args.date:
+        m = mt.iloc[0].to_dict()
+        print("=== Market Status ===")
+        print(f"date: {m['date']}")
+        print(f"market_ret: {m['market_ret']:.6f}")
+        print(f"breadth: {m['breadth']:.3f}")
+        print(f"market_anomaly_flag: {int(m['market_anomaly_flag'])}")
+    else:
+        print(f"=== Market Status ({len(mt)} days, {int(mt['market_anomaly_flag'].sum())} flagged) ===")
+        print(mt[["date", "market_ret", "breadth", "market_anomaly_flag"]].to_string(index=False))
 
     print("\n=== Anomalous Tickers (rule-based) ===")
-    rows = dc[(dc["date"] == date) & (dc["anomaly_flag"] == 1)].copy()
     if rows.empty:
         print("None")
         return
     # show key fields
-    show = rows[["ticker","type","ret","ret_z","volz","range_pct","why"]].sort_values("ticker")
+    if args.date:
+        show = rows[CARD_COLUMNS].sort_values("ticker")
+    else:
+        show = rows[["date", *CARD_COLUMNS]].sort_values(["date", "ticker"])
     print(show.to_string(index=False))
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+REGISTRY_VERSION = 1  # bump when an artifact's arrays change meaning
+
+def model_key(params: dict) -> str:
+    """Stable short hash of the parameters an artifact was fitted under."""
+    blob = json.dumps(params, sort_keys=True, default=str).encode()
+    return hashlib.sha1(blob).hexdigest()[:16]
+
+def data_fingerprint(X: np.ndarray) -> str:
+    """Hash of a design matrix, so a model is only reused on identical training rows."""
+    X = np.ascontiguousarray(X)
+    h = hashlib.sha1(str((X.shape, X.dtype.str)).encode())
+    h.update(X.data)
+    return h.hexdigest()[:16]
+
+class ModelRegistry:
+    """Fitted detector artifacts stored as .npz files under `root`.
+
+    Each artifact is addressed by (kind, model_key(params)) and carries its
+    params, creation time and format version, so concurrent writers (e.g. fold
+    workers) never share a file. Artifacts written by another REGISTRY_VERSION
+    are treated as missing.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, f"{kind}-{key}.npz")
+
+    def load(self, kind: str, params: dict) -> dict[str, np.ndarray] | None:
+        path = self._path(kind, model_key(params))
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as z:
+            arrays = {k: z[k] for k in z.files}
+        if int(arrays.pop("registry_version", -1)) != REGISTRY_VERSION:
+            return None
+        arrays.pop("meta", None)
+        return arrays
+
+    def entries(self) -> list[dict]:
+        """Metadata (kind, key, params, version, created) of every stored artifact."""
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for name in sorted(os.listdir(self.root)):
+            if name.endswith(".npz"):
+                with np.load(os.path.join(self.root, name)) as z:
+                    if "meta" in z.files:
+                        out.append(json.loads(str(z["meta"])))
+        return out
+
+    def save(self, kind: str, params: dict, arrays: dict[str, np.ndarray]) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        key = model_key(params)
+        meta = {
+            "kind": kind, "key": key, "params": params, "version": REGISTRY_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        path = self._path(kind, key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, registry_version=REGISTRY_VERSION, meta=json.dumps(meta, default=str), **arrays)
+        os.replace(tmp, path)
+        return key
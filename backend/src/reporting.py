@@ -1,8 +1,17 @@
 from __future__ import annotations
+import numpy as np
 import pandas as pd
+from .config import Thresholds
+from .detectors_rule import rule_type_labels, rule_why_labels
 
-def build_daily_anomaly_card(df: pd.DataFrame, method: str = "rule") -> pd.DataFrame:
-    """Return the per-PDF Daily Anomaly Card columns."""
+def build_daily_anomaly_card(df: pd.DataFrame, method: str = "rule", thr: Thresholds | None = None) -> pd.DataFrame:
+    """Return the per-PDF Daily Anomaly Card columns.
+
+    Rule labels are rendered here from rule_mask, with the thresholds in `thr`.
+    """
+    if method == "rule" and "rule_mask" in df.columns:
+        df = df.assign(type_rule=rule_type_labels(df["rule_mask"], df["ret"]),
+                       why_rule=rule_why_labels(df["rule_mask"], thr))
     if method == "rule":
         flag_col = "anomaly_flag_rule"
         type_col = "type_rule"
@@ -14,27 +23,36 @@ def build_daily_anomaly_card(df: pd.DataFrame, method: str = "rule") -> pd.DataF
 
     cols = ["date","ticker",flag_col,"ret","ret_z","volz","range_pct",type_col,why_col]
     keep = [c for c in cols if c in df.columns]
-    out = df[keep].copy()
-    out = out.rename(columns={
+    out = df[keep].rename(columns={
         flag_col: "anomaly_flag",
         type_col: "type",
         why_col: "why",
     })
-    out["date"] = out["date"].dt.strftime("%Y-%m-%d")
+    # format each distinct date once; categorical keeps one string per day
+    days, codes = np.unique(out["date"].to_numpy(dtype="datetime64[D]"), return_inverse=True)
+    out["date"] = pd.Categorical.from_codes(codes, np.datetime_as_string(days, unit="D"))
     return out.sort_values(["date","ticker"])
 
-def monthly_mini_report(daily_card: pd.DataFrame, market_table: pd.DataFrame, month: str) -> pd.DataFrame:
-    """Monthly mini-report: join market flag onto daily anomalies for given month (YYYY-MM)."""
-    dc = daily_card.copy()
-    dc["date_dt"] = pd.to_datetime(dc["date"])
-    mt = market_table.copy()
-    mt["date_dt"] = pd.to_datetime(mt["date"])
-    mt = mt[["date_dt","market_anomaly_flag","market_ret","breadth"]]
+MONTHLY_COLUMNS = ["date","ticker","type","ret_z","volz","mkt_flag","why","market_ret","breadth"]
 
-    m = dc[dc["date_dt"].dt.strftime("%Y-%m") == month].copy()
-    m = m[m["anomaly_flag"] == 1].copy()
-    m = m.merge(mt, on="date_dt", how="left")
+def _date_keys(s: pd.Series) -> pd.Series:
+    """Dates as YYYY-MM-DD strings whatever they came as (CSV/store strings,
+    categoricals, datetime64), so both sides of a merge agree and the month
+    is a prefix."""
+    return pd.to_datetime(s).dt.strftime("%Y-%m-%d")
 
-    out = m[["date","ticker","type","ret_z","volz","market_anomaly_flag","why","market_ret","breadth"]].copy()
-    out = out.rename(columns={"market_anomaly_flag":"mkt_flag"})
-    return out.sort_values(["date","ticker"])
+def monthly_reports(daily_card: pd.DataFrame, market_table: pd.DataFrame, months: list[str] | None = None) -> dict[str, pd.DataFrame]:
+    """Monthly mini-reports for many months in one pass: anomalies are joined to
+    the market table once and split by month. Keys are YYYY-MM; every month in
+    `months` gets a report (empty if it had no anomalies), otherwise only the
+    months with anomalies do."""
+    m = daily_card[daily_card["anomaly_flag"] == 1].assign(date=lambda d: _date_keys(d["date"]))
+    mt = market_table[["date","market_anomaly_flag","market_ret","breadth"]].assign(date=lambda d: _date_keys(d["date"]))
+    m = m.merge(mt, on="date", how="left")
+    out = m.rename(columns={"market_anomaly_flag":"mkt_flag"})[MONTHLY_COLUMNS].sort_values(["date","ticker"])
+    groups = dict(tuple(out.groupby(out["date"].str[:7], sort=False)))
+    return {mo: groups.get(mo, out.iloc[:0]) for mo in (months if months is not None else sorted(groups))}
+
+def monthly_mini_report(daily_card: pd.DataFrame, market_table: pd.DataFrame, month: str) -> pd.DataFrame:
+    """Monthly mini-report: join market flag onto daily anomalies for given month (YYYY-MM)."""
+    return monthly_reports(daily_card, market_table, [month])[month]
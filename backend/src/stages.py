@@ -0,0 +1,59 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable
+import pandas as pd
+
+STAGE_VERSION = 1  # bump when a stage's output changes meaning
+
+class StageCache:
+    """Pipeline stage outputs pickled under `root`, keyed by content.
+
+    A stage's key hashes its name, its parameters and the keys of the stages it
+    reads from, so a changed input invalidates everything downstream of it and
+    nothing else. Keys are computed before any work is done; run() only calls
+    the stage function on a miss, so upstream stages whose output is not
+    needed are never loaded. With root None nothing is stored and every stage
+    runs. Every run() is logged for explain().
+    """
+
+    def __init__(self, root: str | None):
+        self.root = root
+        self.log: list[dict] = []
+
+    def key(self, name: str, params: dict, *deps: str) -> str:
+        blob = json.dumps([STAGE_VERSION, name, params, deps], sort_keys=True, default=str).encode()
+        return hashlib.sha1(blob).hexdigest()[:16]
+
+    def _path(self, name: str, key: str) -> str:
+        return os.path.join(self.root, f"{name}-{key}.pkl")
+
+    def has(self, name: str, key: str) -> bool:
+        return bool(self.root) and os.path.exists(self._path(name, key))
+
+    def run(self, name: str, key: str, fn: Callable[[], Any]) -> Any:
+        t0 = time.perf_counter()
+        path = self._path(name, key) if self.root else None
+        if path and os.path.exists(path):
+            value, status = pd.read_pickle(path), "hit"
+        else:
+            value = fn()
+            status = "miss" if path else "run"
+            if path:
+                os.makedirs(self.root, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                pd.to_pickle(value, tmp)
+                os.replace(tmp, path)
+        self.log.append({"stage": name, "key": key, "status": status, "seconds": time.perf_counter() - t0})
+        return value
+
+    def explain(self) -> str:
+        """One line per stage run, in completion order. A stage's seconds
+        include any upstream stage it had to run; stages whose output was not
+        needed (everything downstream of them hit) are not listed."""
+        lines = [f"{'stage':<12} {'key':<16} {'status':<6} seconds"]
+        for e in self.log:
+            lines.append(f"{e['stage']:<12} {e['key']:<16} {e['status']:<6} {e['seconds']:.2f}")
+        return "\n".join(lines)
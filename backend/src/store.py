@@ -0,0 +1,267 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+
+STORE_DIR = "store"
+STORE_FORMAT = 2  # bump when the on-disk layout changes
+CURRENT_FILE = "CURRENT"
+DATE_INDEX_FILE = "date_index.npy"
+DATE_INDEX_DTYPE = np.dtype([("date", "<M8[D]"), ("start", "<i8")])
+OUTPUT_TABLES = ["daily_anomaly_card", "market_day_table", "features_and_flags"]
+
+def _month_dirname(m: np.datetime64) -> str:
+    return str(m)  # "YYYY-MM"
+
+def new_version() -> str:
+    """Folder name that sorts by creation time (sub-second, so two publishes
+    from one process in the same second don't collide)."""
+    ns = time.time_ns()
+    return time.strftime("%Y%m%dT%H%M%S", time.localtime(ns // 10**9)) + f".{ns % 10**9:09d}-{os.getpid()}"
+
+def publish_version(root: str, stage: str, version: str, keep: int = 2) -> str:
+    """Rename the finished staging folder to <root>/<version>, point the
+    one-line <root>/CURRENT at it (atomic swap) and drop all but the `keep`
+    newest versions."""
+    os.replace(stage, os.path.join(root, version))
+    tmp = os.path.join(root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+    versions = sorted(v for v in os.listdir(root) if not v.startswith(".") and v != CURRENT_FILE
+                      and os.path.isdir(os.path.join(root, v)))
+    for v in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, v), ignore_errors=True)
+    return version
+
+def current_version(root: str) -> str:
+    with open(os.path.join(root, CURRENT_FILE)) as f:
+        return f.read().strip()
+
+class StoreWriter:
+    """Typed, month-partitioned output tables, published atomically.
+
+    Layout under <out_dir>/store/<version>/: <table>/<YYYY-MM>/part-NNNNN/ with
+    one .npy per column. Numeric and bool columns are stored as they are,
+    dates as datetime64[D], and anything else as int32 codes into a sorted
+    <col>.cats.npy (-1 = missing). Rows of a part are sorted by date (stable,
+    so the card keeps its ticker order within a day) and date_index.npy holds
+    each of its days with the offset of the day's first row. Everything is
+    written to a staging folder.
+    publish() then writes manifest.json, renames the folder into place and
+    swaps the one-line CURRENT pointer, so a reader sees either the previous
+    run or this one, never a partial one.
+
+    append() can be called repeatedly per table (e.g. per ticker batch); each
+    call adds one part to every month it touches.
+    """
+
+    def __init__(self, out_dir: str, params: dict | None = None):
+        self.root = os.path.join(out_dir, STORE_DIR)
+        self.version = new_version()
+        self.stage = os.path.join(self.root, f".staging-{self.version}")
+        self.params = params or {}
+        self.tables: dict[str, dict] = {}
+        shutil.rmtree(self.stage, ignore_errors=True)
+        os.makedirs(self.stage)
+
+    def append(self, name: str, df: pd.DataFrame) -> None:
+        dates = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]")
+        meta = self.tables.setdefault(name, {"columns": None, "partitions": {}, "rows": 0,
+                                             "date_min": None, "date_max": None})
+        cols = {c: _encode(df[c]) if c != "date" else (dates, None) for c in df.columns}
+        kinds = {c: ("category" if cats is not None else a.dtype.str) for c, (a, cats) in cols.items()}
+        if meta["columns"] is None:
+            meta["columns"] = kinds
+        elif list(meta["columns"]) != list(kinds):
+            raise ValueError(f"{name}: appended columns {list(kinds)} differ from {list(meta['columns'])}")
+
+        order = np.argsort(dates, kind="stable")
+        months = dates[order].astype("datetime64[M]")
+        uniq, starts = np.unique(months, return_index=True)
+        bounds = np.append(starts, len(order))
+        for m, lo, hi in zip(uniq, bounds[:-1], bounds[1:]):
+            idx = order[lo:hi]
+            key = _month_dirname(m)
+            parts = meta["partitions"].setdefault(key, [])
+            part = os.path.join(self.stage, name, key, f"part-{len(parts):05d}")
+            os.makedirs(part)
+            for c, (a, cats) in cols.items():
+                np.save(os.path.join(part, f"{c}.npy"), a[idx])
+                if cats is not None:
+                    np.save(os.path.join(part, f"{c}.cats.npy"), cats)
+            days, first = np.unique(dates[idx], return_index=True)
+            index = np.empty(len(days), dtype=DATE_INDEX_DTYPE)
+            index["date"], index["start"] = days, first
+            np.save(os.path.join(part, DATE_INDEX_FILE), index)
+            parts.append(int(hi - lo))
+        if len(dates):
+            lo, hi = str(dates.min()), str(dates.max())
+            meta["date_min"] = lo if meta["date_min"] is None else min(meta["date_min"], lo)
+            meta["date_max"] = hi if meta["date_max"] is None else max(meta["date_max"], hi)
+        meta["rows"] += len(df)
+
+    def publish(self, keep: int = 2) -> str:
+        """Make this run the current one; keep the `keep` newest versions (the
+        previous one stays readable for readers that opened it)."""
+        manifest = {
+            "format": STORE_FORMAT, "version": self.version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "params": self.params, "tables": self.tables,
+        }
+        with open(os.path.join(self.stage, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=1, default=str)
+        return publish_version(self.root, self.stage, self.version, keep)
+
+def _encode(s: pd.Series) -> tuple[np.ndarray, np.ndarray | None]:
+    if isinstance(s.dtype, np.dtype) and s.dtype.kind in "biufM":
+        return s.to_numpy(), None
+    codes, uniques = pd.factorize(s)
+    cats = np.asarray(uniques, dtype=str)
+    # categories sorted, so readers can merge parts with searchsorted
+    order = np.argsort(cats, kind="stable")
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    return np.where(codes >= 0, rank[codes] if len(rank) else codes, -1).astype(np.int32), cats[order]
+
+class StoreReader:
+    """Read side of StoreWriter, pinned to the version that was current when
+    it was opened."""
+
+    def __init__(self, out_dir: str):
+        self.root = os.path.join(out_dir, STORE_DIR)
+        self.version = current_version(self.root)
+        with open(os.path.join(self.root, self.version, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != STORE_FORMAT:
+            raise ValueError(f"store format {self.manifest.get('format')} != {STORE_FORMAT}; "
+                             "rerun walkforward or python -m src.store")
+
+    @staticmethod
+    def exists(out_dir: str) -> bool:
+        return os.path.exists(os.path.join(out_dir, STORE_DIR, CURRENT_FILE))
+
+    def months(self, name: str) -> list[str]:
+        return sorted(self.manifest["tables"][name]["partitions"])
+
+    def _rows(self, part: str, n: int, lo: np.datetime64 | None, hi: np.datetime64 | None,
+              tickers: list[str] | None) -> slice | np.ndarray | None:
+        """Rows of one part dated in [lo, hi] and, with `tickers`, for those
+        tickers: a slice (or index array), None when nothing matches. Binary
+        search on the part's date index, so no data column is opened."""
+        index = np.load(os.path.join(part, DATE_INDEX_FILE))
+        starts = np.append(index["start"], n)
+        r0 = 0 if lo is None else int(starts[np.searchsorted(index["date"], lo)])
+        r1 = n if hi is None else int(starts[np.searchsorted(index["date"], hi, side="right")])
+        if r0 >= r1:
+            return None
+        if tickers is None:
+            return slice(r0, r1)
+        want = np.flatnonzero(np.isin(np.load(os.path.join(part, "ticker.cats.npy")), tickers))
+        hit = np.flatnonzero(np.isin(np.load(os.path.join(part, "ticker.npy"), mmap_mode="r")[r0:r1], want))
+        return r0 + hit if len(hit) else None
+
+    def read(self, name: str, start: str | None = None, end: str | None = None,
+             columns: list[str] | None = None, tickers: list[str] | None = None) -> pd.DataFrame:
+        """Rows dated in [start, end] (either optional), optionally only for
+        `tickers`. Only the month partitions overlapping the range are opened
+        and, through each part's date index, only the matching rows of each
+        (memory-mapped) column are read. `date` comes back as "YYYY-MM-DD"
+        strings, like the CSVs; coded columns as categoricals."""
+        meta = self.manifest["tables"][name]
+        columns = list(meta["columns"]) if columns is None else columns
+        if tickers is not None and "ticker" not in meta["columns"]:
+            raise ValueError(f"{name} has no ticker column")
+        lo = None if start is None else np.datetime64(pd.Timestamp(start).date(), "D")
+        hi = None if end is None else np.datetime64(pd.Timestamp(end).date(), "D")
+        months = [m for m in self.months(name)
+                  if (lo is None or m >= str(lo)[:7]) and (hi is None or m <= str(hi)[:7])]
+        hits = []
+        for m in months:
+            for i, n in enumerate(meta["partitions"][m]):
+                part = os.path.join(self.root, self.version, name, m, f"part-{i:05d}")
+                rows = self._rows(part, n, lo, hi, tickers)
+                if rows is not None:
+                    hits.append((part, rows))
+
+        data = {}
+        for c in set(columns) | {"date"}:
+            arrs = [np.load(os.path.join(d, f"{c}.npy"), mmap_mode="r")[rows] for d, rows in hits]
+            if meta["columns"][c] == "category":
+                part_cats = [np.load(os.path.join(d, f"{c}.cats.npy")) for d, _ in hits]
+                cats = np.unique(np.concatenate(part_cats)) if hits else np.array([], dtype=str)
+                codes = [np.where(a >= 0, np.searchsorted(cats, pc)[a], -1) for a, pc in zip(arrs, part_cats)]
+                data[c] = pd.Categorical.from_codes(np.concatenate(codes) if codes else np.array([], dtype=np.int32), cats)
+            else:
+                data[c] = np.concatenate(arrs) if arrs else np.array([], dtype=np.dtype(meta["columns"][c]))
+
+        days, inv = np.unique(data["date"], return_inverse=True)
+        data["date"] = np.datetime_as_string(days, unit="D")[inv]
+        return pd.DataFrame({c: data[c] for c in columns})
+
+def retire_store(out_dir: str) -> None:
+    """Unpublish the store (a CSV-only run must not leave an older store in
+    front of its CSVs); the version folders stay until the next publish."""
+    try:
+        os.remove(os.path.join(out_dir, STORE_DIR, CURRENT_FILE))
+    except FileNotFoundError:
+        pass
+
+def _store_is_current(out_dir: str, name: str) -> bool:
+    """A published store that is not older than <name>.csv (CSVs edited or
+    replaced after the last publish win)."""
+    if not StoreReader.exists(out_dir):
+        return False
+    csv = os.path.join(out_dir, f"{name}.csv")
+    return not os.path.exists(csv) or (
+        os.path.getmtime(os.path.join(out_dir, STORE_DIR, CURRENT_FILE)) >= os.path.getmtime(csv))
+
+def read_output(out_dir: str, name: str, start: str | None = None, end: str | None = None,
+                tickers: list[str] | None = None, columns: list[str] | None = None) -> pd.DataFrame:
+    """One walkforward output table (only `columns` when given): from the
+    published store when it is at least as new as <name>.csv (reading only the
+    rows in [start, end] for `tickers`), else from the CSV. Store string
+    columns are decoded to plain strings with "" as missing, so both sources
+    give the same frame."""
+    if _store_is_current(out_dir, name):
+        df = StoreReader(out_dir).read(name, start, end, columns=columns, tickers=tickers)
+        for c in df.columns:
+            if isinstance(df[c].dtype, pd.CategoricalDtype):
+                df[c] = df[c].astype("str").replace("", np.nan)
+        return df
+    usecols = None
+    if columns is not None:
+        filters = ["date"] * (start is not None or end is not None) + ["ticker"] * (tickers is not None)
+        usecols = list(dict.fromkeys([*columns, *filters]))
+    df = pd.read_csv(os.path.join(out_dir, f"{name}.csv"), usecols=usecols)
+    if start is not None:
+        df = df[df["date"] >= start]
+    if end is not None:
+        df = df[df["date"] <= end]
+    if tickers is not None:
+        df = df[df["ticker"].isin(tickers)]
+    return (df if columns is None else df[columns]).reset_index(drop=True)
+
+def import_csv(out_dir: str, chunksize: int = 1_000_000) -> str:
+    """Build and publish the store from the output CSVs in `out_dir` (e.g. a
+    run with --output-format csv), reading each in chunks."""
+    writer = StoreWriter(out_dir, {"imported_from": "csv"})
+    for name in OUTPUT_TABLES:
+        path = os.path.join(out_dir, f"{name}.csv")
+        if os.path.exists(path):
+            for chunk in pd.read_csv(path, chunksize=chunksize):
+                writer.append(name, chunk)
+    return writer.publish()
+
+def main():
+    p = argparse.ArgumentParser(description="Build the indexed output store from walkforward's CSVs.")
+    p.add_argument("--out-dir", default="outputs", help="Folder containing the walkforward CSVs.")
+    args = p.parse_args()
+    print(f"Published: {os.path.join(args.out_dir, STORE_DIR, import_csv(args.out_dir))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+SYNTH_META = "synthetic.json"
+
+def synthetic_tickers(n: int) -> list[str]:
+    return [f"S{i:05d}" for i in range(n)]
+
+def _ticker_frame(i: int, dates: pd.DatetimeIndex, market: np.ndarray, seed: int, rates: dict) -> tuple[pd.DataFrame, list]:
+    # one generator per ticker, so ticker i is identical whatever the universe size
+    rng = np.random.default_rng([seed, i])
+    start = int(rng.integers(0, len(dates) // 4)) if rng.random() < 0.2 else 0  # some list late
+    d = dates[start:]
+    n = len(d)
+    beta = rng.uniform(0.5, 1.5)
+    vol = rng.uniform(0.01, 0.03)
+    ret = beta * market[start:] + rng.standard_t(4, n) * vol / np.sqrt(2)
+    log_vol = np.log(rng.uniform(2e5, 2e7)) + 0.3 * np.abs(ret) / vol + rng.normal(0, 0.3, n)
+    rng_frac = np.abs(rng.normal(0, vol, n)) + 0.002
+
+    events = []
+    for kind in ("crash", "volume_shock", "range_spike"):
+        hit = np.flatnonzero(rng.random(n) < rates[kind])
+        hit = hit[hit > 0]  # day 0 has no return
+        if kind == "crash":
+            ret[hit] = -rng.uniform(6, 12, len(hit)) * vol
+        elif kind == "volume_shock":
+            log_vol[hit] += np.log(rng.uniform(5, 15, len(hit)))
+        else:
+            rng_frac[hit] *= rng.uniform(4, 8, len(hit))
+        events += [(d[j], kind) for j in hit]
+
+    close = 20 * np.exp(rng.uniform(0, 3)) * np.exp(np.cumsum(np.clip(ret, -0.9, None)))
+    open_ = close / (1 + ret) * (1 + rng.normal(0, vol / 4, n))
+    high = np.maximum(open_, close) * (1 + rng_frac / 2)
+    low = np.minimum(open_, close) * (1 - rng_frac / 2)
+    div = np.cumprod(np.where(rng.random(n) < 1 / 63, 1 - rng.uniform(0.002, 0.01, n), 1.0))
+    frame = pd.DataFrame({
+        "Date": d.strftime("%Y-%m-%d"), "Open": open_, "High": high, "Low": low, "Close": close,
+        "Adj Close": close * div[-1] / div, "Volume": np.exp(log_vol).astype(np.int64),
+    })
+    return frame, events
+
+def generate_market(
+    data_dir: str,
+    n_tickers: int,
+    years: float,
+    end: str = "2020-06-30",
+    seed: int = 0,
+    etf_share: float = 0.1,
+    crash_rate: float = 0.002,
+    volume_shock_rate: float = 0.003,
+    range_spike_rate: float = 0.003,
+    market_crash_rate: float = 0.002,
+) -> pd.DataFrame:
+    """Write a deterministic synthetic market in the Kaggle layout load_universe reads.
+
+    Every ticker gets `years` of business days ending at `end` (20% list later)
+    with fat-tailed returns driven by one market factor. Crashes, volume shocks
+    and range spikes are injected per ticker at the given daily rates, and
+    market-wide crashes hit every ticker on the same day. Every `1/etf_share`-th
+    ticker goes to etfs/, the rest to stocks/. Returns the injected events
+    (ticker, date, kind), which are also written to events.csv as ground truth;
+    the parameters go to synthetic.json.
+    """
+    dates = pd.bdate_range(end=pd.Timestamp(end), periods=max(int(round(years * 252)), 2))
+    rng = np.random.default_rng([seed, 2**31])
+    market = rng.normal(0.0003, 0.008, len(dates))
+    crash_days = np.flatnonzero(rng.random(len(dates)) < market_crash_rate)
+    market[crash_days] = -rng.uniform(0.05, 0.10, len(crash_days))
+    rates = {"crash": crash_rate, "volume_shock": volume_shock_rate, "range_spike": range_spike_rate}
+
+    for sub in ("stocks", "etfs"):
+        os.makedirs(os.path.join(data_dir, sub), exist_ok=True)
+    etf_every = int(round(1 / etf_share)) if etf_share > 0 else 0
+    rows = []
+    for i, t in enumerate(synthetic_tickers(n_tickers)):
+        frame, events = _ticker_frame(i, dates, market, seed, rates)
+        sub = "etfs" if etf_every and i % etf_every == 0 else "stocks"
+        frame.to_csv(os.path.join(data_dir, sub, f"{t}.csv"), index=False, float_format="%.6f")
+        listed = pd.Timestamp(frame["Date"].iloc[0])
+        rows += [(t, e, k) for e, k in events]
+        rows += [(t, dates[j], "market_crash") for j in crash_days if dates[j] > listed]
+
+    ev = pd.DataFrame(rows, columns=["ticker", "date", "kind"]).sort_values(["date", "ticker", "kind"])
+    ev.to_csv(os.path.join(data_dir, "events.csv"), index=False, date_format="%Y-%m-%d")
+    with open(os.path.join(data_dir, SYNTH_META), "w") as f:
+        json.dump({"tickers": n_tickers, "years": years, "end": end, "seed": seed, "etf_share": etf_share,
+                   **{f"{k}_rate": v for k, v in rates.items()}, "market_crash_rate": market_crash_rate}, f, indent=1)
+    return ev
+
+def main():
+    p = argparse.ArgumentParser(description="Generate a deterministic synthetic OHLCV market (stocks/ + etfs/ CSVs) with injected anomalies.")
+    p.add_argument("--out-dir", default="data/synthetic", help="Folder to write stocks/, etfs/, events.csv into.")
+    p.add_argument("--tickers", type=int, default=100, help="Number of tickers.")
+    p.add_argument("--years", type=float, default=5, help="Years of business days per ticker.")
+    p.add_argument("--end", default="2020-06-30", help="Last date (walkforward's splits need 2018-2020).")
+    p.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = p.parse_args()
+
+    ev = generate_market(args.out_dir, args.tickers, args.years, end=args.end, seed=args.seed)
+    print(f"Wrote {args.tickers} tickers x {args.years:g} years to {args.out_dir}")
+    print(ev["kind"].value_counts().to_string())
+    print(f"Universe: --universe {','.join(synthetic_tickers(min(args.tickers, 5)))}{',...' if args.tickers > 5 else ''}")
+
+if __name__ == "__main__":
+    main()
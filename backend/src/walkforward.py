@@ -1,24 +1,64 @@
 from __future__ import annotations
 import argparse
 import os
+from dataclasses import asdict
+import sys
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
 
-from .config import DEFAULT_UNIVERSE, Windows, Thresholds
-from .io_utils import load_universe
-from .features import compute_features
-from .detectors_rule import detect_rule_based
-from .market import compute_market_table
+from .config import DEFAULT_UNIVERSE, Windows, Thresholds, FeatureBank
+from .io_utils import load_universe, universe_fingerprint
+from .panel import PanelStore, write_panel
+from .registry import ModelRegistry, data_fingerprint
+from .backtest import month_folds, run_folds, history_drift
+from .features import FLOAT_FEATURES, compute_features, compute_feature_bank
+from .incremental import read_features, update_features
+from .parallel import STAGES, load_features_sharded, format_shard_report
+from .detectors_rule import detect_rule_based, rule_type_labels
+from .market import compute_market_table, compute_market_table_panel, update_market_table
 from .reporting import build_daily_anomaly_card
-
-# Optional clustering
-from .detectors_kmeans import fit_kmeans_train, kmeans_distance_to_centroid, per_cluster_thresholds, flag_kmeans
-from .detectors_dbscan import fit_dbscan
+from .stages import StageCache
+from .chunked import run_chunked
+from . import profiling
+from .store import OUTPUT_TABLES, STORE_DIR, StoreWriter, retire_store
 
 def _parse_methods(s: str) -> list[str]:
     return [x.strip().lower() for x in s.split(",") if x.strip()]
 
+def _parse_bank(s: str) -> FeatureBank:
+    # "ret_z=21,63,126;volz=21;range_pct=63" -> FeatureBank (omitted features get no windows)
+    fields = {"ret_z": "w_return", "volz": "w_volume", "range_pct": "w_range"}
+    kw = {f: () for f in fields.values()}
+    for part in s.split(";"):
+        if not part.strip():
+            continue
+        name, _, ws = part.partition("=")
+        if name.strip() not in fields:
+            raise ValueError(f"unknown feature {name.strip()!r} in --feature-bank (use ret_z, volz, range_pct)")
+        kw[fields[name.strip()]] = tuple(int(w) for w in ws.split(",") if w.strip())
+    return FeatureBank(**kw)
+
+def _features(raw: pd.DataFrame, args) -> pd.DataFrame:
+    float_dtype = np.float32 if args.lean else np.float64
+    if args.lean:
+        raw["ticker"] = raw["ticker"].astype("category")
+    if args.state_dir:
+        # the nightly update only computes new bars; the outputs cover the full history
+        update_features(raw, args.state_dir, windows=Windows())
+        feat = read_features(args.state_dir, tickers=raw["ticker"].unique())
+        return feat.astype({c: float_dtype for c in FLOAT_FEATURES}) if args.lean else feat
+    return compute_features(raw, windows=Windows(), float_dtype=float_dtype)
+
+def _finish(args, profiler: profiling.Profiler | None, **extra) -> None:
+    if profiler:
+        path = os.path.join(args.out_dir, "profile.json")
+        for f in profiler.write(path, argv=sys.argv[1:], **extra):
+            print(f"Wrote: {f}")
+        profiling.stop()
+    peak = profiling.peak_rss_mb()
+    if peak is not None:
+        print(f"Peak RSS: {peak:.0f} MB")
+
 def main():
     p = argparse.ArgumentParser(description="Compute features + detect anomalies + write required CSVs.")
     p.add_argument("--data-dir", default="data/raw", help="Folder containing stocks/ and etfs/ subfolders.")
@@ -27,32 +67,145 @@ def main():
     p.add_argument("--methods", default="rule", help="Comma-separated: rule,kmeans,dbscan (optional).")
     p.add_argument("--k", type=int, default=8, help="KMeans k (optional).")
     p.add_argument("--q", type=float, default=97.5, help="KMeans cluster distance percentile threshold (optional).")
+    p.add_argument("--kmeans-mode", default="full", choices=["full", "minibatch"], help="KMeans training: full-batch, or MiniBatchKMeans.partial_fit over streamed chunks.")
+    p.add_argument("--kmeans-chunk", type=int, default=50_000, help="Rows per partial_fit chunk in --kmeans-mode minibatch.")
+    p.add_argument("--model-dir", default=None, help="Model registry: reuse fitted scaler/KMeans/DBSCAN artifacts stored here instead of refitting.")
+    p.add_argument("--fold-workers", type=int, default=1, help="Run walk-forward month folds (DBSCAN) in N processes.")
+    p.add_argument("--dbscan-history", default="full", choices=["full", "window", "sample"], help="DBSCAN fold history: full expanding window, last --max-history rows, or a weighted subsample of that size.")
+    p.add_argument("--max-history", type=int, default=200_000, help="Row cap for --dbscan-history window/sample.")
+    p.add_argument("--history-drift", action="store_true", help="With a bounded --dbscan-history, also run the full-history baseline and write dbscan_history_drift.csv.")
     p.add_argument("--eps", type=float, default=0.9, help="DBSCAN eps (optional starting point).")
     p.add_argument("--min-samples", type=int, default=15, help="DBSCAN min_samples.")
+    p.add_argument("--workers", type=int, default=1, help="Shard tickers across N processes for load/features/rule detection.")
+    p.add_argument("--state-dir", default=None, help="Persist rolling feature state here; later runs only compute features for new bars.")
+    p.add_argument("--verify-state", action="store_true", help="With --state-dir, also rebuild the market table from scratch and fail if the incremental one differs.")
+    p.add_argument("--feature-bank", default=None, help="Also write feature_bank.csv, e.g. 'ret_z=21,63,126,252;volz=21,63;range_pct=63'.")
+    p.add_argument("--cache-dir", default=None, help="Keep a binary cache of parsed CSVs here; only new/changed files are re-parsed.")
+    p.add_argument("--panel-dir", default=None, help="Also write the loaded OHLCV data as a memory-mapped dates x tickers panel here and compute the market table from it.")
+    p.add_argument("--market-weights", default="equal", help="Comma-separated market_ret/breadth weightings: equal,volume,cap (cap needs a market_cap column).")
+    p.add_argument("--stage-dir", default=None, help="Cache each pipeline stage's output here, keyed by a hash of its inputs and config; reruns only recompute stages whose inputs changed.")
+    p.add_argument("--explain", action="store_true", help="Print which stages were cache hits and which were recomputed.")
+    p.add_argument("--memory-budget", type=float, default=None, help="Out-of-core mode (rule only): stream ticker batches sized to about this many MB through features/rules and write outputs incrementally.")
+    p.add_argument("--output-format", default="both", choices=["csv", "store", "both"], help="CSVs, the month-partitioned columnar store under <out-dir>/store (published atomically), or both.")
+    p.add_argument("--profile", action="store_true", help="Write profile.json to --out-dir: wall/CPU time, peak RSS growth and rows per stage.")
+    p.add_argument("--profile-hot", action="store_true", help="Implies --profile; also cProfile the slowest top-level stage (profile.prof, profile.txt).")
+    p.add_argument("--lean", action="store_true", help="Memory-lean layout: categorical tickers, float32 feature columns.")
     args = p.parse_args()
 
     universe = [t.strip().upper() for t in args.universe.split(",") if t.strip()]
     methods = _parse_methods(args.methods)
+    if args.workers > 1 and args.state_dir:
+        p.error("--workers and --state-dir cannot be combined")
+    if args.workers > 1 and args.panel_dir:
+        p.error("--workers and --panel-dir cannot be combined")
+    if args.stage_dir and (args.workers > 1 or args.state_dir):
+        p.error("--stage-dir cannot be combined with --workers or --state-dir")
+
+    if args.memory_budget:
+        if set(methods) - {"rule"}:
+            p.error("--memory-budget runs the rule detector only")
+        if args.workers > 1 or args.state_dir or args.stage_dir or args.panel_dir or args.feature_bank:
+            p.error("--memory-budget cannot be combined with --workers, --state-dir, --stage-dir, --panel-dir or --feature-bank")
 
     os.makedirs(args.out_dir, exist_ok=True)
+    profiler = profiling.start(hot=args.profile_hot) if args.profile or args.profile_hot else None
+    writer = StoreWriter(args.out_dir, params=vars(args)) if args.output_format != "csv" else None
+    if writer is None:
+        retire_store(args.out_dir)  # readers would otherwise keep serving the previous run's store
+    if args.memory_budget:
+        report = run_chunked(
+            args.data_dir, universe, args.out_dir, args.memory_budget, windows=Windows(), thr=Thresholds(),
+            weights=args.market_weights.split(","), lean=args.lean, cache_dir=args.cache_dir,
+            csv=args.output_format != "store", writer=writer,
+        )
+        print(f"Chunked run: {report['rows']} rows in {report['batches']} batches, {report['dates']} market days")
+        if args.output_format != "store":
+            for name in OUTPUT_TABLES:
+                print(f"Wrote: {os.path.join(args.out_dir, name + '.csv')}")
+        if writer:
+            print(f"Published: {os.path.join(args.out_dir, STORE_DIR, profiling.timed('publish store', writer.publish))}")
+        _finish(args, profiler)
+        return
+    cache = StageCache(args.stage_dir)
+    windows, thr = Windows(), Thresholds()
+    weights = args.market_weights.split(",")
+    if args.workers > 1:
+        with profiling.stage("load_features_sharded") as rec:
+            feat, det, shard_report = load_features_sharded(
+                args.data_dir, universe, args.workers, windows=windows, thr=thr, lean=args.lean,
+                cache_dir=args.cache_dir,
+            )
+            rec["rows"] = len(feat)
+            # the shards' own stages ran in worker processes
+            for name in STAGES:
+                for i, (w, c, n) in enumerate(zip(*(shard_report[k][name] for k in ("wall", "cpu", "rows")))):
+                    profiling.record(f"{name} shard {i}", w, c, n, worker=True)
+            profiling.record("shard pool", shard_report["pool_wall"], sum(map(sum, shard_report["cpu"].values())), worker=True)
+            profiling.record("shard gather", shard_report["gather_wall"], shard_report["gather_cpu"], len(feat))
+        print(format_shard_report(shard_report))
+        rules_key = market_key = None  # no stage cache with --workers
+    else:
+        # stage keys: the CSVs' path/size/mtime, then each stage's config plus
+        # the keys of its inputs
+        load_key = cache.key("load", {"files": universe_fingerprint(args.data_dir, universe)})
+        feat_key = cache.key("features", {"windows": asdict(windows), "lean": args.lean}, load_key)
+        rules_key = cache.key("rules", asdict(thr), feat_key)
+        market_key = cache.key("market", {"windows": asdict(windows), "thr": asdict(thr), "weights": weights,
+                                          **({"source": "panel"} if args.panel_dir else {})}, feat_key)
+        load = lambda: cache.run("load", load_key, lambda: profiling.timed(
+            "load_universe", lambda: load_universe(args.data_dir, universe, cache_dir=args.cache_dir)))
 
-    raw = load_universe(args.data_dir, universe)
-    feat = compute_features(raw, windows=Windows())
+        # load as its own top-level stage, and only when a later stage needs the rows
+        need_feat = args.feature_bank or not (cache.has("rules", rules_key) and cache.has("market", market_key))
+        raw = load() if args.panel_dir or (need_feat and not cache.has("features", feat_key)) else None
+        if args.panel_dir:
+            profiling.timed("write_panel", lambda: write_panel(raw, args.panel_dir))
+            print(f"Wrote panel: {args.panel_dir}")
+        feat = None
+        if need_feat:
+            feat = cache.run("features", feat_key, lambda: profiling.timed("compute_features", lambda: _features(raw, args)))
+        del raw
+        # Rule-based detector (required)
+        det = cache.run("rules", rules_key, lambda: profiling.timed("detect_rule_based", lambda: detect_rule_based(feat, thr=thr)))
 
     # Market table is computed from features (uses per-ticker returns)
-    market_table = compute_market_table(feat, windows=Windows(), thr=Thresholds())
-    market_table.to_csv(os.path.join(args.out_dir, "market_day_table.csv"), index=False)
+    if args.state_dir:
+        market_table = profiling.timed("update_market_table", lambda: update_market_table(
+            feat, args.state_dir, windows=windows, thr=thr, weights=weights, verify=args.verify_state))
+    elif args.panel_dir:
+        # axis reductions over the panel just written, instead of groupbys over feat
+        market_table = cache.run("market", market_key, lambda: profiling.timed(
+            "compute_market_table_panel", lambda: compute_market_table_panel(
+                PanelStore(args.panel_dir), windows=windows, thr=thr, weights=weights)))
+    else:
+        market_table = cache.run("market", market_key, lambda: profiling.timed(
+            "compute_market_table", lambda: compute_market_table(feat, windows=windows, thr=thr, weights=weights)))
+
+    if args.feature_bank:
+        bank = compute_feature_bank(feat[["date","ticker","open","high","low","close","adj_close","volume"]], _parse_bank(args.feature_bank))
+        bank_cols = [c for c in bank.columns if c.rsplit("_w", 1)[-1].isdigit()]
+        bank[["date","ticker"] + bank_cols].to_csv(os.path.join(args.out_dir, "feature_bank.csv"), index=False)
+        print(f"Wrote: {os.path.join(args.out_dir, 'feature_bank.csv')}")
 
-    # Rule-based detector (required)
-    det = detect_rule_based(feat, thr=Thresholds())
+    # det holds every row and column used from here on
+    del feat
 
     # Start with rule outputs as baseline
-    out_df = det.copy()
+    out_df = det
 
     # ---- Optional clustering detectors (per PDF methodology section) ----
     if any(m in methods for m in ["kmeans","dbscan"]):
+        # Optional clustering; sklearn is imported here because it alone adds
+        # ~90 MB to the process, which rule-only runs don't need
+        from sklearn.preprocessing import StandardScaler
+        from .detectors_kmeans import (
+            fit_kmeans_train, fit_kmeans_minibatch, iter_chunks,
+            nearest_centroid, per_cluster_thresholds, flag_kmeans,
+        )
+        from .detectors_dbscan import dbscan_fold
+
         # build design matrix using only non-null feature rows
-        Xdf = out_df.dropna(subset=["ret_z","volz","range_pct"]).copy()
+        Xdf = out_df.dropna(subset=["ret_z","volz","range_pct"])
         Xdf["date"] = pd.to_datetime(Xdf["date"])
         Xdf["year"] = Xdf["date"].dt.year
 
@@ -62,80 +215,134 @@ def main():
         test_mask  = (Xdf["date"] >= "2020-01-01") & (Xdf["date"] <= "2020-03-31")
 
         feats = Xdf[["ret_z","volz","range_pct"]].to_numpy(dtype=float)
-        scaler = StandardScaler()
-        scaler.fit(feats[train_mask.values])
-        X_scaled = scaler.transform(feats)
 
-        # KMeans
+        # model registry: artifacts are keyed by feature config, training range
+        # and a hash of the training rows, so they're reused only when valid
+        registry = ModelRegistry(args.model_dir) if args.model_dir else None
+        reg_base = {
+            "features": ["ret_z","volz","range_pct"], "windows": asdict(windows),
+            "train": "2018", "data": data_fingerprint(feats[train_mask.values]),
+        } if registry else None
+
+        saved = registry.load("scaler", reg_base) if registry else None
+        if saved is None:
+            scaler = StandardScaler()
+            scaler.fit(feats[train_mask.values])
+            saved = {"mean": scaler.mean_, "scale": scaler.scale_}
+            if registry:
+                registry.save("scaler", reg_base, saved)
+        X_scaled = (feats - saved["mean"]) / saved["scale"]  # == StandardScaler.transform
+
+        # KMeans: the fit doesn't depend on q, so it is its own stage and a
+        # new percentile only redoes the thresholds
         if "kmeans" in methods:
-            km = fit_kmeans_train(X_scaled[train_mask.values], k=args.k)
-            train_labels, train_d = kmeans_distance_to_centroid(km, X_scaled[train_mask.values])
-            thr_by_cluster = per_cluster_thresholds(train_labels, train_d, q=args.q)
+            X_train = X_scaled[train_mask.values]
+            fit_key = cache.key("kmeans_fit", {"k": args.k, "mode": args.kmeans_mode,
+                                               "chunk": args.kmeans_chunk if args.kmeans_mode == "minibatch" else None}, rules_key)
 
-            labels_all, d_all = kmeans_distance_to_centroid(km, X_scaled)
-            flags_all = flag_kmeans(labels_all, d_all, thr_by_cluster)
+            def fit_centers():
+                if args.kmeans_mode == "minibatch":
+                    km = fit_kmeans_minibatch(iter_chunks(X_train, args.kmeans_chunk), k=args.k)
+                else:
+                    km = fit_kmeans_train(X_train, k=args.k)
+                return km.cluster_centers_
 
-            Xdf["kmeans_cluster"] = labels_all
-            Xdf["kmeans_dist"] = d_all
-            Xdf["anomaly_flag_kmeans"] = flags_all
+            def score_kmeans():
+                km_params = {**reg_base, "k": args.k, "q": args.q, "mode": args.kmeans_mode,
+                             "chunk": args.kmeans_chunk if args.kmeans_mode == "minibatch" else None} if registry else None
+                saved = registry.load("kmeans", km_params) if registry else None
+                if saved is None:
+                    centers = cache.run("kmeans_fit", fit_key, lambda: profiling.timed("kmeans_fit", fit_centers))
+                    train_labels, train_d = nearest_centroid(centers, X_train)
+                    saved = {
+                        "centers": centers,
+                        "thresholds": per_cluster_thresholds(train_labels, train_d, q=args.q, n_clusters=args.k),
+                    }
+                    if registry:
+                        registry.save("kmeans", km_params, saved)
+                labels_all, d_all = nearest_centroid(saved["centers"], X_scaled)
+                return {"kmeans_cluster": labels_all, "kmeans_dist": d_all,
+                        "anomaly_flag_kmeans": flag_kmeans(labels_all, d_all, saved["thresholds"])}
+
+            km_out = cache.run("kmeans", cache.key("kmeans", {"q": args.q}, fit_key),
+                               lambda: profiling.timed("kmeans", score_kmeans))
+            for c, v in km_out.items():
+                Xdf[c] = v
+            flags_all = km_out["anomaly_flag_kmeans"]
 
             # Simple "why" and "type" for clustering output (still use rule labels for crash/spike direction)
             Xdf["why_kmeans"] = np.where(flags_all==1, f"dist > cluster_p{args.q}", "")
-            Xdf["type_kmeans"] = np.where(flags_all==1, Xdf["type_rule"], "")
+            Xdf["type_kmeans"] = np.where(flags_all==1, rule_type_labels(Xdf["rule_mask"], Xdf["ret"]), "")
 
         # DBSCAN (simple monthly walk-forward on expanding window)
         if "dbscan" in methods:
-            Xdf = Xdf.sort_values("date").reset_index(drop=True)
-            flags = np.zeros(len(Xdf), dtype=int)
-            labels = np.full(len(Xdf), -999, dtype=int)
-
-            # score months in Val+Test; fit on expanding history up to prior day
-            score_mask = val_mask | test_mask
-            months = sorted(Xdf.loc[score_mask, "date"].dt.to_period("M").unique().tolist())
-            for m in months:
-                month_mask = (Xdf["date"].dt.to_period("M") == m) & score_mask
-                if not month_mask.any():
-                    continue
-                first_day = Xdf.loc[month_mask, "date"].min()
-                hist_mask = Xdf["date"] < first_day
-                if hist_mask.sum() < 200:
-                    # need some history for DBSCAN to behave reasonably
-                    continue
-
-                X_hist = X_scaled[hist_mask.values]
-                X_block = X_scaled[month_mask.values]
-
-                model = fit_dbscan(X_hist, eps=args.eps, min_samples=args.min_samples)
-                # DBSCAN has no predict; approximate by fitting on hist+block to label the block
-                X_combo = np.vstack([X_hist, X_block])
-                combo_model = fit_dbscan(X_combo, eps=args.eps, min_samples=args.min_samples)
-                combo_labels = combo_model.labels_
-                block_labels = combo_labels[-len(X_block):]
-
-                labels[month_mask.values] = block_labels
-                flags[month_mask.values] = (block_labels == -1).astype(int)
+            # score months in Val+Test; fit on expanding history up to prior day,
+            # then label the month against the history model's core samples
+            order = np.argsort(Xdf["date"].to_numpy(), kind="stable")
+            score_mask = (val_mask | test_mask).to_numpy()[order]
+            # need some history for DBSCAN to behave reasonably
+            folds = month_folds(Xdf["date"].to_numpy()[order], score_mask, min_history=200)
+            fold_kw = dict(eps=args.eps, min_samples=args.min_samples, model_dir=args.model_dir, reg_params=reg_base)
+            want_drift = args.history_drift and args.dbscan_history != "full"
+
+            def score_dbscan():
+                sorted_labels = run_folds(
+                    dbscan_fold, X_scaled[order], folds, workers=args.fold_workers,
+                    history=args.dbscan_history, max_history=args.max_history, **fold_kw,
+                )
+                labels = np.empty_like(sorted_labels)
+                labels[order] = sorted_labels
+                drift = None
+                if want_drift:
+                    base = run_folds(dbscan_fold, X_scaled[order], folds, workers=args.fold_workers, **fold_kw)
+                    drift = history_drift(folds, base, sorted_labels)
+                return {"labels": labels, "drift": drift}
+
+            db_key = cache.key("dbscan", {"eps": args.eps, "min_samples": args.min_samples, "history": args.dbscan_history,
+                                          "max_history": args.max_history, "drift": want_drift}, rules_key)
+            db_out = cache.run("dbscan", db_key, lambda: profiling.timed("dbscan", score_dbscan))
+            labels, drift = db_out["labels"], db_out["drift"]
+            flags = (labels == -1).astype(np.int8)
+
+            if drift is not None:
+                drift.to_csv(os.path.join(args.out_dir, "dbscan_history_drift.csv"), index=False)
+                print(f"DBSCAN {args.dbscan_history} history (max {args.max_history} rows) vs full: "
+                      f"anomaly rate {drift['rate_bounded'].mean():.4f} vs {drift['rate_full'].mean():.4f}, "
+                      f"mean |drift| {drift['drift'].abs().mean():.4f}, "
+                      f"flag agreement {(drift['agree'] * drift['rows']).sum() / max(drift['rows'].sum(), 1):.4f}")
 
             Xdf["dbscan_label"] = labels
             Xdf["anomaly_flag_dbscan"] = flags
             Xdf["why_dbscan"] = np.where(flags==1, "DBSCAN label = -1 (noise)", "")
-            Xdf["type_dbscan"] = np.where(flags==1, Xdf["type_rule"], "")
+            Xdf["type_dbscan"] = np.where(flags==1, rule_type_labels(Xdf["rule_mask"], Xdf["ret"]), "")
 
-        # merge back into out_df on (date,ticker)
+        # merge back into out_df on (date,ticker); rule columns are already there
+        new_cols = [c for c in Xdf.columns if c not in out_df.columns]
         out_df = out_df.merge(
-            Xdf[["date","ticker"] + [c for c in Xdf.columns if c.startswith("anomaly_flag_") or c.endswith("_dist") or c.endswith("_label") or c.endswith("_cluster") or c.startswith("why_") or c.startswith("type_")]],
+            Xdf[["date","ticker"] + [c for c in new_cols if c.startswith("anomaly_flag_") or c.endswith("_dist") or c.endswith("_label") or c.endswith("_cluster") or c.startswith("why_") or c.startswith("type_")]],
             on=["date","ticker"], how="left"
         )
+        # rows without all three features can't be scored: not flagged, like the rule flag
+        for c in ("anomaly_flag_kmeans", "anomaly_flag_dbscan"):
+            if c in out_df.columns:
+                out_df[c] = out_df[c].fillna(0).astype(np.int8)
 
     # daily anomaly card: by default, write rule-based. You can switch method in code if needed.
-    daily_card = build_daily_anomaly_card(out_df, method="rule")
-    daily_card.to_csv(os.path.join(args.out_dir, "daily_anomaly_card.csv"), index=False)
-
-    # also store a richer parquet/csv for convenience
-    out_df.to_csv(os.path.join(args.out_dir, "features_and_flags.csv"), index=False)
-
-    print(f"Wrote: {os.path.join(args.out_dir, 'daily_anomaly_card.csv')}")
-    print(f"Wrote: {os.path.join(args.out_dir, 'market_day_table.csv')}")
-    print(f"Wrote: {os.path.join(args.out_dir, 'features_and_flags.csv')}")
+    daily_card = profiling.timed("build_daily_anomaly_card", lambda: build_daily_anomaly_card(out_df, method="rule", thr=Thresholds()))
+    outputs = {"daily_anomaly_card": daily_card, "market_day_table": market_table, "features_and_flags": out_df}
+    if args.output_format in ("csv", "both"):
+        for name, df in outputs.items():
+            with profiling.stage(f"write {name}.csv", len(df)):
+                df.to_csv(os.path.join(args.out_dir, f"{name}.csv"), index=False)
+            print(f"Wrote: {os.path.join(args.out_dir, name + '.csv')}")
+    if writer:
+        for name, df in outputs.items():
+            with profiling.stage(f"store {name}", len(df)):
+                writer.append(name, df)
+        print(f"Published: {os.path.join(args.out_dir, STORE_DIR, profiling.timed('publish store', writer.publish))}")
+    if args.explain:
+        print(cache.explain())
+    _finish(args, profiler, stage_cache=cache.log)
     print("Next: python -m src.query --out-dir outputs --date 2020-02-27")
 
 if __name__ == "__main__":
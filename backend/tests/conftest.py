@@ -0,0 +1,15 @@
+import pytest
+from src.features import compute_features
+from src.io_utils import load_universe
+from src.synthetic import generate_market, synthetic_tickers
+
+@pytest.fixture(scope="session")
+def raw(tmp_path_factory):
+    """Two years of a 30-ticker synthetic market (some tickers list late)."""
+    data_dir = str(tmp_path_factory.mktemp("market"))
+    generate_market(data_dir, 30, 2, seed=1)
+    return load_universe(data_dir, synthetic_tickers(30))
+
+@pytest.fixture(scope="session")
+def feat(raw):
+    return compute_features(raw)
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.market import MarketState, _rolling_past_quantile, compute_market_table, update_market_table
+
+@pytest.mark.parametrize("weights", [None, ["equal", "volume"]])
+def test_incremental_table_matches_full_build(feat, tmp_path, weights):
+    dates = np.sort(feat["date"].unique())
+    for cut in (dates[100], dates[101], dates[300], dates[-20], dates[-1]):
+        part = feat[feat["date"] <= cut]
+        table = update_market_table(part, str(tmp_path), weights=weights)
+        pd.testing.assert_frame_equal(table, compute_market_table(part, weights=weights))
+
+def test_rolling_window_matches_quantile():
+    rng = np.random.default_rng(0)
+    for w, q in [(63, 0.95), (5, 0.5), (7, 0.0), (7, 1.0), (1, 0.95)]:
+        x = np.abs(rng.normal(size=300)).round(1)  # ties
+        x[[40, 41, 200]] = np.nan
+        state = MarketState(w, q, 0.3, [], np.datetime64("NaT", "ns"), x[:50][-w:])
+        got = []
+        for v in x[50:]:
+            got.append(state.threshold())
+            state.push(v)
+        np.testing.assert_array_equal(got, _rolling_past_quantile(x, w, q)[50:])
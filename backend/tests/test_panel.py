@@ -0,0 +1,35 @@
+import numpy as np
+from src.features import compute_features
+from src.market import compute_market_table, compute_market_table_panel
+from src.panel import PanelStore, write_panel
+
+def test_market_table_panel_matches_long(raw, tmp_path):
+    # missing bars inside a ticker's history: returns span the gap, as in the long frame
+    raw = raw.drop(raw.index[100:110]).drop(raw.index[5000:5003]).reset_index(drop=True)
+    write_panel(raw, str(tmp_path))
+    weights = ["equal", "volume"]
+    expected = compute_market_table(compute_features(raw), weights=weights)
+    got = compute_market_table_panel(PanelStore(str(tmp_path)), weights=weights, block=7)
+
+    assert list(got.columns) == list(expected.columns)
+    np.testing.assert_array_equal(got["date"].to_numpy(dtype="datetime64[ns]"), expected["date"].to_numpy(dtype="datetime64[ns]"))
+    np.testing.assert_array_equal(got["breadth"], expected["breadth"])
+    np.testing.assert_array_equal(got["market_anomaly_flag"], expected["market_anomaly_flag"])
+    np.testing.assert_allclose(got["market_ret"], expected["market_ret"], rtol=0, atol=1e-15)
+    for c in ("market_ret_volume", "breadth_volume"):  # weights from float32 volumes
+        np.testing.assert_allclose(got[c], expected[c], rtol=0, atol=1e-6)
+
+def test_open_reader_survives_rewrite(raw, tmp_path):
+    tickers = raw["ticker"].unique()
+    write_panel(raw[raw["ticker"].isin(tickers[:5])], str(tmp_path))
+    old = PanelStore(str(tmp_path))
+    before = np.array(old.series(tickers[0], "close")[1])
+
+    bigger = raw[raw["ticker"].isin(tickers[:6])].assign(close=lambda d: d["close"] * 2)
+    for _ in range(3):  # prunes the version `old` has open
+        write_panel(bigger, str(tmp_path))
+
+    np.testing.assert_array_equal(old.series(tickers[0], "close")[1], before)
+    new = PanelStore(str(tmp_path))
+    assert len(new.tickers) == 6
+    np.testing.assert_allclose(new.series(tickers[0], "close")[1], before * 2)